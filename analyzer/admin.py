@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Project, Repository, Commit, Author, Alias, Contrib
+from .models import Project, Repository, Commit, Author, Alias, Contrib, AnalysisJob
 from django import forms
 
 class ProjectAdmin(admin.ModelAdmin):
@@ -23,7 +23,7 @@ class ProjectListFilter(admin.SimpleListFilter):
             return queryset
         
 class RepositoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'last_fetch', 'project','lines','contributors','skip','success')
+    list_display = ('name', 'last_fetch', 'project','lines','contributors','files','skip','success')
     list_filter = (ProjectListFilter,'skip','success')
     list_editable = ('skip','success') 
 
@@ -45,10 +45,15 @@ class AliasAdmin(admin.ModelAdmin):
 class ContribAdmin(admin.ModelAdmin):
     list_display = ('author', 'count', 'repository') 
 
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('repository', 'source', 'status', 'pushes', 'run_after', 'finished')
+    list_filter = ('status', 'source')
+
 # Register your models here.
 admin.site.register(Project, ProjectAdmin)
 admin.site.register(Repository, RepositoryAdmin)
 admin.site.register(Commit, CommitAdmin)
 admin.site.register(Author, AuthorAdmin)
 admin.site.register(Alias, AliasAdmin)
-admin.site.register(Contrib, ContribAdmin)
\ No newline at end of file
+admin.site.register(Contrib, ContribAdmin)
+admin.site.register(AnalysisJob, AnalysisJobAdmin)
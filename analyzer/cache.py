@@ -0,0 +1,155 @@
+"""
+Caching of the dashboard API responses.
+
+The aggregations only change when analyze writes to the database, and every
+write bumps the Generation counter. Responses are cached under a key that
+includes the generation, so entries made before a write are never read again
+and age out of the cache (settings.CACHES['api']).
+
+The same counter provides the ETags of the API, so that clients can revalidate
+what they already have with a conditional GET.
+
+The async_ variants do the same for the async views, whose database access has
+to go through the async ORM.
+"""
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.core.cache import caches
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from rest_framework import response
+
+from .models import Generation, Repository
+
+
+def request_generation(request):
+    """Returns: the data generation, read once per request"""
+    request = getattr(request, '_request', request)  # unwrap the DRF request
+    if not hasattr(request, 'generation'):
+        request.generation = Generation.current()
+    return request.generation
+
+
+async def arequest_generation(request):
+    """Returns: the data generation, read once per request"""
+    if not hasattr(request, 'generation'):
+        request.generation = await Generation.acurrent()
+    return request.generation
+
+
+def cache_key(request, generation):
+    """Returns: cache key for the path and query parameters of the request.
+    The windows of the aggregations end today, so the date is part of it."""
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    digest = hashlib.md5(repr((request.path, params)).encode('utf-8')).hexdigest()
+    return f'api:{generation}:{timezone.localdate().isoformat()}:{digest}'
+
+
+def cached_response(view):
+    """Cache the data of successful responses of a viewset method"""
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        cache = caches['api']
+        key = cache_key(request, request_generation(request))
+        data = cache.get(key)
+        if data is not None:
+            return response.Response(data)
+
+        result = view(self, request, *args, **kwargs)
+        if result.status_code == 200:
+            cache.set(key, result.data)
+        return result
+    return wrapper
+
+
+def async_cached_response(view):
+    """Cache the JSON of successful responses of an async view"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        cache = caches['api']
+        key = cache_key(request, await arequest_generation(request))
+        content = await cache.aget(key)
+        if content is not None:
+            return HttpResponse(content, content_type='application/json')
+
+        result = await view(request, *args, **kwargs)
+        if result.status_code == 200:
+            await cache.aset(key, result.content)
+        return result
+    return wrapper
+
+
+def make_etag(request, generation):
+    """Returns: ETag for the data generation, the date, the full path and the
+    requested representation (JSON or the browsable API)"""
+    key = (f"{generation}:{timezone.localdate().isoformat()}:{request.get_full_path()}:"
+           f"{request.headers.get('Accept', '')}")
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def fetched_repositories(request, kwargs):
+    """Returns: queryset of the repositories behind the request, the
+    repository or project of a detail route or else all of them"""
+    repositories = Repository.objects.all()
+    pk = str(kwargs.get('pk', ''))
+    url_name = request.resolver_match.url_name if request.resolver_match else ''
+    if pk.isdigit() and url_name.startswith('repository-'):
+        repositories = repositories.filter(pk=pk)
+    elif pk.isdigit() and url_name.startswith('project-'):
+        repositories = repositories.filter(project_id=pk)
+    return repositories
+
+
+def api_etag(request, *args, **kwargs):
+    return make_etag(request, request_generation(request))
+
+
+def api_last_modified(request, *args, **kwargs):
+    """Returns: the newest last_fetch of the repositories behind the request"""
+    return fetched_repositories(request, kwargs).aggregate(last_fetch=Max('last_fetch'))['last_fetch']
+
+
+def conditional_state(request, kwargs):
+    """Returns: the data generation, which the response cache reuses, and the
+    Last-Modified time of the request"""
+    return request_generation(request), api_last_modified(request, **kwargs)
+
+
+# Viewset class decorator: answers If-None-Match and If-Modified-Since with a
+# 304 before the view runs, and makes clients revalidate every time
+conditional = method_decorator(
+    [condition(etag_func=api_etag, last_modified_func=api_last_modified), cache_control(no_cache=True)],
+    name='dispatch')
+
+
+def async_conditional(view):
+    """conditional for async views. Django's condition() would call the ETag
+    and Last-Modified functions synchronously, which the ORM does not allow
+    from the event loop. Both are read in one sync_to_async call rather than
+    a thread hop per async query."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        generation, last_fetch = await sync_to_async(conditional_state)(request, kwargs)
+        etag = quote_etag(make_etag(request, generation))
+        last_modified = timegm(last_fetch.utctimetuple()) if last_fetch else None
+
+        result = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if result is None:
+            result = await view(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and result.status_code in (200, 304):
+            result.headers.setdefault('ETag', etag)
+            if last_modified and not result.has_header('Last-Modified'):
+                result.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(result, no_cache=True)
+        return result
+    return wrapper
@@ -1,7 +1,55 @@
 from git import Repo
 from git.exc import GitCommandError
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from itertools import islice
+import codecs
 import gc
+import hashlib
 import os
+import re
+import resource
+import sys
+import tempfile
+import time
+from fnmatch import fnmatch
+from urllib.parse import urlsplit
+
+
+# A commit as read from the git log stream, field names follow git.Commit
+LogEntry = namedtuple('LogEntry', ['hexsha', 'author_name', 'author_email', 'committed_datetime', 'message'])
+
+# Fields are NUL separated and with -z every commit is NUL terminated as well,
+# so a record is always five fields no matter what the message contains.
+LOG_FORMAT = '%H%x00%an%x00%ae%x00%ct%x00%B'
+LOG_FIELDS = 5
+
+# Line counting engines, see Command.line_counts of the analyze command
+BLAME = 'blame'
+REPLAY = 'replay'
+
+# A file as listed by git ls-tree -l
+TreeFile = namedtuple('TreeFile', ['path', 'blob', 'size'])
+
+# Files that are not worth counting: larger blobs are almost always generated
+# or data, and these globs match lockfiles, bundles and vendored code. A glob
+# without a slash matches the file name, one with a slash matches at any depth.
+MAX_BLOB_SIZE = 1024 * 1024
+EXCLUDES = [
+    '*.min.js', '*.min.css', '*.map', '*.lock', '*.lockb', 'package-lock.json', 'pnpm-lock.yaml', 'go.sum',
+    'node_modules/*', 'bower_components/*', 'vendor/*', 'third_party/*',
+]
+# Attributes that mark a file as not hand written, e.g. 'dist/* linguist-generated'.
+# 'name' matches a set or true attribute, '-name' an unset one and
+# 'name=value' that value, as in .gitattributes.
+SKIP_ATTRIBUTES = ['binary', '-diff', 'linguist-generated', 'linguist-vendored']
+# Like git, treat a file as binary if there is a NUL within its first 8000 bytes
+BINARY_SNIFF = 8000
+# Bytes read at a time from a blob that is not kept
+CHUNK_SIZE = 65536
+
+HUNK = re.compile(rb'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
 
 
 def get_default_branch(repo):
@@ -46,48 +94,518 @@ def get_default_branch(repo):
     raise ValueError("No branches found in repository")
 
 
-def count_lines_by_author(repo, branch=None):
-    """Count lines of code by author in the given repository.
-    Does not checkout or modify the working directory.
-    
+def list_blobs(repo, commit, max_size=MAX_BLOB_SIZE, excludes=EXCLUDES, text_blobs=frozenset(),
+               attributes=SKIP_ATTRIBUTES, sniff=True):
+    """List the files in the given commit that should have their lines counted.
+    Args: repo: git.Repo object
+          commit: branch name or commit SHA
+          max_size, excludes, text_blobs, attributes, sniff: see filter_files
+    Returns: tuple of a dictionary of paths and blob SHAs and a dictionary of
+             the number of files skipped for each reason"""
+    files, skipped = filter_files(repo, commit, list_files(repo, commit), max_size, excludes, text_blobs,
+                                  attributes, sniff)
+    return {f.path: f.blob for f in files}, skipped
+
+
+def list_files(repo, commit):
+    """List the regular files in a commit with their sizes in a single
+    git ls-tree pass. Symbolic links and submodules are left out.
+    Returns: list of TreeFile tuples"""
+    files = []
+    for record in repo.git.ls_tree('-r', '-l', '-z', commit).split('\0'):
+        if not record:
+            continue
+        info, path = record.split('\t', 1)
+        mode, kind, blob, size = info.split()
+        if kind == 'blob' and mode != '120000':
+            files.append(TreeFile(path, blob, int(size)))
+    return files
+
+
+def filter_files(repo, commit, files, max_size=MAX_BLOB_SIZE, excludes=EXCLUDES, text_blobs=frozenset(),
+                 attributes=SKIP_ATTRIBUTES, sniff=True):
+    """Drop the files that should not be blamed. The cheap checks come first:
+    path globs, then the blob size from ls-tree, then the attributes and
+    finally a look at the start of the remaining blobs for binary content.
+
     Args: repo: git.Repo object
-          branch: branch to analyze (if None, auto-detects default branch)
+          commit: the commit the files are from, its .gitattributes apply
+          files: list of TreeFile tuples
+          max_size: largest blob to count, in bytes (0 for no limit)
+          excludes: list of path globs
+          text_blobs: SHAs of blobs already known to be text, typically those
+                      counted by the previous run, which are not read again
+          attributes: list of attributes that skip a file, see SKIP_ATTRIBUTES
+          sniff: whether to skip blobs with a NUL byte near the start
+    Returns: tuple of the remaining files and a dictionary of the number of
+             files skipped for each reason"""
+    skipped = {'path': 0, 'size': 0, 'attributes': 0, 'binary': 0}
+    kept = []
+    for f in files:
+        if is_excluded(f.path, excludes):
+            skipped['path'] += 1
+        elif max_size and f.size > max_size:
+            skipped['size'] += 1
+        else:
+            kept.append(f)
+
+    names = sorted({rule.lstrip('-').split('=', 1)[0] for rule in attributes})
+    values = check_attributes(repo, commit, [f.path for f in kept], names) if names else {}
+    files, kept = kept, []
+    for f in files:
+        attrs = values.get(f.path, {})
+        if any(has_attribute(attrs, rule) for rule in attributes):
+            skipped['attributes'] += 1
+        elif sniff and f.blob not in text_blobs and is_binary(repo, f.blob):
+            skipped['binary'] += 1
+        else:
+            kept.append(f)
+
+    return kept, skipped
+
+
+def is_excluded(path, excludes):
+    name = path.rsplit('/', 1)[-1]
+    for pattern in excludes:
+        if '/' in pattern:
+            if fnmatch(path, pattern) or fnmatch(path, '*/' + pattern):
+                return True
+        elif fnmatch(name, pattern):
+            return True
+    return False
+
+
+def has_attribute(attrs, rule):
+    """Returns: whether attribute values from check_attributes match a rule
+    of SKIP_ATTRIBUTES"""
+    if rule.startswith('-'):
+        return attrs.get(rule[1:]) == 'unset'
+    name, _, value = rule.partition('=')
+    return attrs.get(name) == value if value else attrs.get(name) in ('set', 'true')
+
+
+def check_attributes(repo, commit, paths, names):
+    """Look up attributes for many paths with one git check-attr process.
+    Attributes come from the .gitattributes files of the commit, not of the
+    working tree: the commit is read into a temporary index, since
+    check-attr --source needs git 2.40.
+    Returns: dictionary of paths and their attribute values ('set', 'unset',
+             'unspecified' or the value)"""
+    if not paths:
+        return {}
+
+    with tempfile.TemporaryDirectory() as index_dir, tempfile.TemporaryFile() as paths_file:
+        env = {'GIT_INDEX_FILE': os.path.join(index_dir, 'index')}
+        repo.git.read_tree(commit, env=env)
+        paths_file.write('\0'.join(paths).encode('utf-8') + b'\0')
+        paths_file.seek(0)
+        output = repo.git.check_attr('--cached', '-z', '--stdin', *names, istream=paths_file, env=env)
+
+    attributes = {}
+    fields = output.split('\0')
+    for path, attribute, value in zip(fields[0::3], fields[1::3], fields[2::3]):
+        attributes.setdefault(path, {})[attribute] = value
+    return attributes
+
+
+def is_binary(repo, blob):
+    _, _, size, stream = repo.git.stream_object_data(blob)
+    head = stream.read(min(size, BINARY_SNIFF))
+    # The rest has to be consumed before the next object, without holding
+    # all of it in memory
+    remaining = size - len(head)
+    while remaining > 0:
+        chunk = stream.read(min(remaining, CHUNK_SIZE))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+    return b'\0' in head
+
+
+def changed_paths(repo, old, new):
+    """Find the files that changed between two commits using git diff --name-status.
+    Renames are reported as a deletion and an addition.
+
+    Args: repo: git.Repo object
+          old: SHA of the previously analyzed commit
+          new: SHA of the commit being analyzed
+    Returns: tuple of the added or modified paths and the deleted paths, or
+             None if the old commit is no longer available"""
+    try:
+        output = repo.git.diff('--name-status', '--no-renames', '-z', old, new)
+    except GitCommandError:
+        return None
+
+    fields = output.split('\0')
+    changed, deleted = set(), set()
+    for status, path in zip(fields[0::2], fields[1::2]):
+        if status == 'D':
+            deleted.add(path)
+        else:
+            changed.add(path)
+    return changed, deleted
+
+
+def blame_file(repo, commit, path):
+    """Count the lines in a file by author with git blame --incremental.
+    The output is read from the pipe one line at a time. It has an entry per
+    group of lines rather than per line and the author of a commit is only
+    given the first time the commit appears, so memory use does not grow with
+    the size of the file.
     Returns: dictionary of author names and line counts"""
-    
-    if branch is None:
-        branch = get_default_branch(repo)
-    
-    lines_by_author = {}
-    file_count = 0
-    
+    counts = {}
+    for author, _, lines in blame_groups(repo, commit, path):
+        counts[author] = counts.get(author, 0) + lines
+    return counts
+
+
+def blame_owners(repo, commit, path):
+    """Find the author of every line of a file with git blame, for files the
+    replay engine has no owners of. Unlike a replay, lines brought in by a
+    merge belong to the author of the commit that wrote them.
+    Returns: owner list (one author per line)"""
+    owners = []
+    for author, start, lines in sorted(blame_groups(repo, commit, path), key=lambda group: group[1]):
+        owners.extend([author] * lines)
+    return owners
+
+
+def blame_groups(repo, commit, path):
+    """Read git blame --incremental output from the pipe.
+    Returns: generator of (author, first line, number of lines) tuples, in the
+    order git finds them"""
+    authors = {}
+    sha = None
+    proc = repo.git.blame('--incremental', commit, '--', path, as_process=True)
+    for line in proc.stdout:
+        if sha is None:
+            # <sha> <line in original file> <line in final file> <number of lines>
+            sha, _, start, lines = line.split()
+        elif line.startswith(b'author '):
+            authors[sha] = line[7:].rstrip(b'\n').decode('utf-8', 'replace')
+        elif line.startswith(b'filename '):
+            yield authors[sha], int(start), int(lines)
+            sha = None
+
+    proc.wait()  # raises GitCommandError if the file cannot be blamed
+
+
+def blame_files(repo, commit, paths, workers=1):
+    """Blame each of the given files.
+    Files that cannot be blamed are reported with empty counts. With more
+    than one worker the results come back in the order they complete.
+
+    Args: repo: git.Repo object
+          commit: branch name or commit SHA
+          paths: iterable of file paths
+          workers: number of blame processes to run at the same time
+    Returns: generator of (path, line counts by author) tuples"""
+    if workers > 1:
+        results = blame_concurrently(repo, commit, paths, workers)
+    else:
+        results = (blame_path(repo, commit, path) for path in paths)
+
+    for file_count, result in enumerate(results, 1):
+        yield result
+
+        if file_count % 100 == 0:
+            print(f"    Processed {file_count} files...")
+            # Force garbage collection every 100 files to prevent memory buildup
+            gc.collect()
+
+
+def blame_path(repo, commit, path):
     try:
-        tree = repo.tree(branch)
-        for item in tree.traverse():
-            if item.type != 'blob':  # Skip directories
-                continue
-                
-            file_count += 1
-            try:
-                # Use splitlines() which is more memory efficient than split('\n')
-                # Process incrementally without storing the full string
-                for line in repo.git.blame('--line-porcelain', branch, '--', item.path).splitlines():
-                    if line.startswith('author '):
-                        author = line[6:]
-                        lines_by_author[author] = lines_by_author.get(author, 0) + 1
-                
-                if file_count % 100 == 0:
-                    print(f"    Processed {file_count} files...")
-                    # Force garbage collection every 100 files to prevent memory buildup
-                    gc.collect()
-                    
-            except GitCommandError:
-                # Skip files that can't be blamed (binary, etc.)
-                continue
-                
-    except (GitCommandError, ValueError) as e:
-        print(f"Warning: Could not analyze branch '{branch}': {e}")
-    
-    return lines_by_author
+        return path, blame_file(repo, commit, path)
+    except GitCommandError:
+        # Skip files that can't be blamed (binary, etc.)
+        return path, {}
+
+
+def blame_concurrently(repo, commit, paths, workers):
+    """Blame files on a pool of threads, each waiting on its own git process.
+    New files are only submitted as results are taken, so no more than two
+    blames per worker are ever in flight and memory use does not depend on
+    the number of files."""
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(blame_path, repo, commit, path) for path in islice(paths, workers * 2)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                for path in islice(paths, 1):
+                    pending.add(pool.submit(blame_path, repo, commit, path))
+
+
+def iter_log(repo, *args, revisions=None, chunk_size=65536):
+    """Stream commits from a single `git log` process.
+    Unlike repo.iter_commits no GitPython objects are created, the output is
+    read in chunks and each commit is yielded as soon as it has been parsed.
+
+    Args: repo: git.Repo object
+          args: extra arguments for git log such as '--all' or a revision range
+          revisions: list of revisions passed on standard input, there can be
+                     more of them than fit on a command line
+          chunk_size: number of bytes read from the pipe at a time
+    Returns: generator of LogEntry tuples, newest first"""
+    if revisions is None:
+        proc = repo.git.log('-z', f'--format={LOG_FORMAT}', *args, as_process=True)
+    else:
+        with tempfile.TemporaryFile() as revisions_file:
+            revisions_file.write(''.join(f'{rev}\n' for rev in revisions).encode('utf-8'))
+            revisions_file.seek(0)
+            proc = repo.git.log('-z', f'--format={LOG_FORMAT}', '--stdin', *args,
+                                as_process=True, istream=revisions_file)
+    fields = []
+    remainder = b''
+    for chunk in iter(lambda: proc.stdout.read(chunk_size), b''):
+        parts = (remainder + chunk).split(b'\0')
+        remainder = parts.pop()
+        for part in parts:
+            fields.append(part)
+            if len(fields) == LOG_FIELDS:
+                yield parse_log_entry(fields)
+                fields = []
+
+    proc.wait()  # raises GitCommandError on a bad revision
+
+
+def parse_log_entry(fields):
+    """Convert the raw fields of one log record into a LogEntry"""
+    hexsha, name, email, timestamp, message = (f.decode('utf-8', 'replace') for f in fields)
+    return LogEntry(hexsha, name, email,
+                    datetime.fromtimestamp(int(timestamp), tz=timezone.utc),
+                    message.rstrip('\n'))
+
+
+def replay_ownership(repo, old, new, load=lambda path: None):
+    """Find the author of every line by replaying the first parent diffs
+    between two commits. Only the hunk headers of a zero context diff are
+    needed: deleted lines are removed from a file's owner list and added lines
+    are inserted with the author of the commit.
+
+    Args: repo: git.Repo object
+          old: SHA of the commit the known owners belong to, None to replay
+               the whole history
+          new: branch name or SHA of the commit to replay up to
+          load: function returning the owner list of a path at the old commit,
+                or None if it is not known
+    Returns: dictionary of the paths touched and their owner lists (one author
+             per line), None for files that were deleted"""
+    touched = {}
+    names = {}
+    author = None
+    changes = []
+    skip = 0
+
+    def current(path):
+        if path not in touched:
+            touched[path] = load(path)
+        return touched[path] or []
+
+    def apply():
+        # All sources are read before any destination is written, files can
+        # swap names within a commit.
+        sources = {change['src']: current(change['src']) for change in changes if change['src']}
+        for path in sources:
+            touched[path] = None
+        for change in changes:
+            if change['dst'] and not change['binary']:
+                lines = sources.get(change['src'], [])
+                touched[change['dst']] = apply_hunks(lines, change['hunks'], author)
+        changes.clear()
+
+    proc = repo.git.log('--first-parent', '--reverse', '--diff-merges=first-parent', '-p', '-U0', '-M',
+                        '--no-color', '--no-ext-diff', '--src-prefix=a/', '--dst-prefix=b/',
+                        '--format=%x00%aN', f'{old}..{new}' if old else new, as_process=True)
+    for line in proc.stdout:
+        if skip:
+            # Content lines of the current hunk, only their number matters
+            if not line.startswith(b'\\'):
+                skip -= 1
+            continue
+
+        if line.startswith(b'\0'):
+            apply()
+            name = line[1:].rstrip(b'\n').decode('utf-8', 'replace')
+            author = names.setdefault(name, name)
+        elif line.startswith(b'diff --git '):
+            path = diff_git_path(line[11:].rstrip(b'\n'))
+            changes.append({'src': path, 'dst': path, 'hunks': [], 'binary': False})
+        elif not changes:
+            continue
+        elif line.startswith(b'@@ '):
+            match = HUNK.match(line)
+            a, b, c, d = (int(g) if g is not None else 1 for g in match.groups())
+            changes[-1]['hunks'].append((a, b, d))
+            skip = b + d
+        elif line.startswith(b'new file mode'):
+            changes[-1]['src'] = None
+        elif line.startswith(b'deleted file mode'):
+            changes[-1]['dst'] = None
+        elif line.startswith(b'rename from '):
+            changes[-1]['src'] = unquote_path(line[12:].rstrip(b'\n'))
+        elif line.startswith(b'rename to '):
+            changes[-1]['dst'] = unquote_path(line[10:].rstrip(b'\n'))
+        elif line.startswith(b'Binary files '):
+            changes[-1]['binary'] = True
+
+    apply()
+    proc.wait()
+    return touched
+
+
+def apply_hunks(lines, hunks, author):
+    """Apply the hunks of a zero context diff to a file's owner list.
+    Args: lines: owner list of the file before the change
+          hunks: list of (old start, deleted count, added count) tuples
+          author: author of the added lines
+    Returns: the new owner list"""
+    result = []
+    pos = 0
+    for start, deleted, added in hunks:
+        # Without deletions the start is the line the insertion follows
+        start = start - 1 if deleted else start
+        result.extend(lines[pos:start])
+        result.extend([author] * added)
+        pos = start + deleted
+    result.extend(lines[pos:])
+    return result
+
+
+def diff_git_path(names):
+    """Extract the path from the 'a/path b/path' part of a diff --git line.
+    Both halves are the same unless the file was renamed, in which case the
+    rename lines that follow have the real names."""
+    half = (len(names) - 1) // 2
+    return unquote_path(names[:half])[2:]
+
+
+def unquote_path(path):
+    """Decode a path from git diff output, undoing C style quoting"""
+    if path.startswith(b'"') and path.endswith(b'"'):
+        path = codecs.escape_decode(path[1:-1])[0]
+    return path.decode('utf-8', 'replace')
+
+
+def encode_owners(lines):
+    """Run length encode an owner list as [[author, count], ...]"""
+    encoded = []
+    for author in lines:
+        if encoded and encoded[-1][0] == author:
+            encoded[-1][1] += 1
+        else:
+            encoded.append([author, 1])
+    return encoded
+
+
+def decode_owners(encoded):
+    """Expand a run length encoded owner list"""
+    lines = []
+    for author, count in encoded:
+        lines.extend([author] * count)
+    return lines
+
+
+def reset_peak_rss():
+    """Start measuring the peak memory use of this process afresh.
+    Only possible on Linux, elsewhere the peak covers the whole process."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """Peak resident set size of this process since reset_peak_rss.
+    Returns: the peak in MB"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # bytes on macOS, KB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak
+
+
+def fetch(repo, timeout=300, retries=2):
+    """Fetch from origin. git is killed if it takes longer than timeout
+    seconds and failed fetches are tried again, waiting a little longer
+    before each attempt.
+    Raises: GitCommandError when the last attempt fails"""
+    for attempt in range(retries + 1):
+        try:
+            repo.git.fetch('origin', kill_after_timeout=timeout)
+            return
+        except GitCommandError:
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def ref_tips(repo):
+    """List the commits (or tags) at the tips of all refs.
+    Returns: sorted list of unique SHAs"""
+    output = repo.git.for_each_ref('--format=%(objectname) %(objecttype)')
+    return sorted({line.split()[0] for line in output.splitlines() if line.split()[1] in ('commit', 'tag')})
+
+
+def existing_objects(repo, shas):
+    """Filter out the objects that are no longer in the repository, for
+    example the old tip of a branch that was force pushed and pruned.
+    Returns: list of SHAs"""
+    existing = []
+    for sha in shas:
+        try:
+            repo.git.get_object_header(sha)
+            existing.append(sha)
+        except ValueError:
+            pass
+    return existing
+
+
+def ref_fingerprint(repo):
+    """Hash the tips of all refs (branches, remote branches and tags).
+    The hash only changes when some ref moved, so a repository with the same
+    fingerprint as last time has nothing new to analyze.
+    Returns: SHA-1 hex digest"""
+    output = repo.git.for_each_ref('--format=%(objectname) %(refname)')
+    return hashlib.sha1(output.encode('utf-8')).hexdigest()
+
+
+def filters_digest(max_size, excludes, attributes=SKIP_ATTRIBUTES, sniff=True):
+    """Hash the options that decide which files are counted, see filter_files.
+    Line counts made with other filters have to be made again.
+    Returns: SHA-1 hex digest"""
+    filters = (max_size, sorted(excludes))
+    if sorted(attributes) != sorted(SKIP_ATTRIBUTES) or not sniff:
+        # Digests stored before these were options stay valid for the defaults
+        filters += (sorted(attributes), sniff)
+    return hashlib.sha1(repr(filters).encode('utf-8')).hexdigest()
+
+
+def normalize_url(url):
+    """Reduce the https, ssh and scp like forms of a remote URL to the same
+    string so that they can be compared. Bitbucket Server serves https clones
+    below /scm/, which is dropped as well.
+    Returns: lower case host/path, for example github.com/owner/name"""
+    url = url.strip().lower()
+    if '://' in url:
+        parts = urlsplit(url)
+        host, path = parts.hostname or '', parts.path
+    elif ':' in url.split('/')[0]:
+        host, path = url.split(':', 1)
+        host = host.split('@')[-1]
+    else:
+        host, path = '', url
+    path = path.strip('/').removesuffix('.git')
+    path = path.removeprefix('scm/')
+    return f'{host}/{path}'
 
 
 def get_last_modified_time(repo_path):
@@ -100,9 +618,3 @@ def get_last_modified_time(repo_path):
         return timezone.make_aware(dt) if dt.tzinfo is None else dt
     except StopIteration:
         return None
-    
-
-if __name__ == '__main__':
-    print(count_lines_by_author(
-        open_repo('/home/raditha/workspace/python/CSI/selenium/repos/EMPI/csi-empi-api/'))       
-    )
\ No newline at end of file
@@ -7,85 +7,351 @@ In case some projects or repositories do not need analysis their skip flag can
 be set to True.
 """
 import gc
+import multiprocessing
 import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+
 from git import GitCommandError, Repo
 from gitdb.exc import BadName
 
-from django.core.management.base import BaseCommand     
+from django.core.management.base import BaseCommand
 from django.utils.text import slugify
-from django.db import transaction, models
+from django.db import connections, transaction, models
 from django.utils import timezone
 
-from analyzer.importer import count_lines_by_author,get_last_modified_time
-from analyzer.models import Author, Repository, Commit, Contrib, Project
+from analyzer.importer import BLAME, EXCLUDES, MAX_BLOB_SIZE, REPLAY, SKIP_ATTRIBUTES, blame_file, blame_files
+from analyzer.importer import blame_owners, changed_paths, decode_owners, encode_owners, existing_objects, fetch
+from analyzer.importer import filters_digest, get_default_branch, get_last_modified_time, iter_log, list_blobs
+from analyzer.importer import list_files, peak_rss, ref_fingerprint, ref_tips, replay_ownership, reset_peak_rss
+from analyzer.models import AnalysisJob, BlameFile, DailyCommits, Generation, Repository, Commit, Contrib, Project
+from analyzer.models import author_cache
+from analyzer.workers import import_worker, init_worker
+
+SUCCESS = 'success'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+SYMBOLS = {SUCCESS: '✓', SKIPPED: '⏭', FAILED: '✗'}
+
+
+def should_fetch(repo_path, skip_fetch_hours):
+    """Skip fetch if the last commit in the repo is recent enough"""
+    if skip_fetch_hours > 0:
+        try:
+            last_commit_time = get_last_modified_time(repo_path)
+            if last_commit_time:
+                time_since_commit = timezone.now() - last_commit_time
+                if time_since_commit < timedelta(hours=skip_fetch_hours):
+                    hours_ago = int(time_since_commit.total_seconds() // 3600)
+                    print(f'    Skipping fetch of {repo_path} (last commit {hours_ago}h ago)')
+                    return False
+        except:
+            pass  # If we can't determine last commit time, fetch anyway
+    return True
+
+
+def fetch_worker(repo_path, skip_fetch_hours=24, fetch_timeout=300, fetch_retries=2):
+    """The fetch stage of analyze --fetch-jobs, runs on a thread and does not
+    touch the database.
+    Returns: tuple of the path and the error message if the fetch failed"""
+    try:
+        repo = Repo(repo_path)
+    except Exception:
+        return repo_path, None  # import_repo reports it
+    try:
+        if should_fetch(repo_path, skip_fetch_hours):
+            print(f'    Fetching {repo_path}...')
+            fetch(repo, fetch_timeout, fetch_retries)
+        return repo_path, None
+    except GitCommandError as e:
+        return repo_path, str(e)
 
 class Command(BaseCommand):
     
     def add_arguments(self, parser):
         parser.add_argument('location', type=str)
-        parser.add_argument('--timestamp', type=str, required=False, help='Only check for commits that are newer than the given timestamp')
+        parser.add_argument('--timestamp', type=str, required=False, help='Check the whole history again for commits that are newer than the given timestamp')
         parser.add_argument('--all', action='store_true', help='Process all projects and repositories recursively')
+        parser.add_argument('--jobs', type=int, default=1, help='Number of repositories to analyze in parallel with --all (default: 1)')
+        parser.add_argument('--fetch-jobs', type=int, default=1,
+                            help='Number of repositories to fetch at the same time with --all; each one is analyzed '
+                                 'as soon as its fetch completes (default: 1)')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue the repositories for analyze_worker at background priority instead of analyzing them')
+        self.add_analysis_arguments(parser)
+
+    def add_analysis_arguments(self, parser):
+        """The options that control how a single repository is analyzed,
+        shared with analyze_worker"""
         parser.add_argument('--no-fetch', action='store_true', help='Dont fetch the repository before analyzing it')
         parser.add_argument('--skip-blame', action='store_true', help='Skip line counting (much faster, only processes commits)')
         parser.add_argument('--skip-fetch-hours', type=int, default=24, help='Skip fetching if last fetch was within N hours (default: 24)')
         parser.add_argument('--skip-analysis-hours', type=int, default=24, help='Skip analysis if last analyzed within N hours (default: 24, 0 to disable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of commits saved per transaction (default: 1000)')
+        parser.add_argument('--lines-engine', choices=[BLAME, REPLAY], default=BLAME,
+                            help='Count lines with git blame or by replaying first parent diffs (default: blame)')
+        parser.add_argument('--lines-validate', type=int, default=0, metavar='N',
+                            help='Compare the line counts of N random files with git blame')
+        parser.add_argument('--blame-workers', type=int, default=1,
+                            help='Number of files to blame at the same time within a repository (default: 1)')
+        parser.add_argument('--max-blob-size', type=int, default=MAX_BLOB_SIZE,
+                            help=f'Skip files larger than this many bytes when counting lines (default: {MAX_BLOB_SIZE}, 0 for no limit)')
+        parser.add_argument('--exclude', action='append', metavar='GLOB',
+                            help='Skip files matching the glob when counting lines, in addition to lockfiles, '
+                                 'minified bundles and vendored directories (repeatable)')
+        parser.add_argument('--skip-attributes', type=str, default=','.join(SKIP_ATTRIBUTES), metavar='RULES',
+                            help='Comma separated .gitattributes rules of the files not counted: name for a set '
+                                 'attribute, -name for an unset one, name=value '
+                                 f'(default: {",".join(SKIP_ATTRIBUTES)}, empty for none)')
+        parser.add_argument('--no-binary-check', action='store_true',
+                            help='Count blobs with a NUL byte near the start instead of skipping them as binary')
+        parser.add_argument('--fetch-timeout', type=int, default=300, help='Seconds before a fetch is abandoned (default: 300)')
+        parser.add_argument('--fetch-retries', type=int, default=2, help='Number of times a failed fetch is retried (default: 2)')
+
+    def analysis_options(self, options):
+        """Returns: keyword arguments for import_repo from the options added
+        by add_analysis_arguments"""
+        return {
+            'timestamp': options.get('timestamp'),
+            'no_fetch': options['no_fetch'],
+            'skip_blame': options['skip_blame'],
+            'skip_fetch_hours': options['skip_fetch_hours'],
+            'skip_analysis_hours': options['skip_analysis_hours'],
+            'batch_size': options['batch_size'],
+            'lines_engine': options['lines_engine'],
+            'lines_validate': options['lines_validate'],
+            'blame_workers': options['blame_workers'],
+            'max_blob_size': options['max_blob_size'],
+            'excludes': EXCLUDES + (options['exclude'] or []),
+            'skip_attributes': [rule for rule in options['skip_attributes'].split(',') if rule],
+            'binary_check': not options['no_binary_check'],
+            'fetch_timeout': options['fetch_timeout'],
+            'fetch_retries': options['fetch_retries'],
+        }
     
     def handle(self, *args, **options):
         repo_path = options['location']
-        timestamp = options['timestamp']
-        skip_fetch_hours = options['skip_fetch_hours']
-        skip_analysis_hours = options['skip_analysis_hours']
-        
+        repo_options = self.analysis_options(options)
+
         if options['all']:
-            for project in os.listdir(repo_path):
-                if os.path.isdir(os.path.join(repo_path, project)) and not project.startswith('.'):
-                    if os.path.isdir(os.path.join(repo_path, project, '.git')):
-                        self.import_repo(repo_path, timestamp, options['no_fetch'], options['skip_blame'], skip_fetch_hours, skip_analysis_hours)
-                    else:   
-                        self.recurse(os.path.join(repo_path, project), timestamp, options['no_fetch'], options['skip_blame'], skip_fetch_hours, skip_analysis_hours)
+            paths = list(self.find_repos(repo_path))
+        else:
+            paths = [repo_path]
+
+        if options['enqueue']:
+            self.enqueue(paths)
+            return
+
+        if options['fetch_jobs'] > 1 and not options['no_fetch'] and len(paths) > 1:
+            results = self.import_pipelined(paths, options['fetch_jobs'], options['jobs'], repo_options)
+        elif options['jobs'] > 1 and len(paths) > 1:
+            results = self.import_parallel(paths, options['jobs'], repo_options)
         else:
-            self.import_repo(repo_path, timestamp, options['no_fetch'], options['skip_blame'], skip_fetch_hours, skip_analysis_hours)
+            results = [self.import_repo(path, **repo_options) for path in paths]
+
+        self.refresh_stats(results)
+        self.report(results)
+
+
+    def find_repos(self, repo_path):
+        """Yields the paths of the repositories below repo_path.
+        Expects the /base-path/project-name/repo-name/ layout, but a repository
+        placed directly under the base path is also accepted."""
+        for project in sorted(os.listdir(repo_path)):
+            if os.path.isdir(os.path.join(repo_path, project)) and not project.startswith('.'):
+                if os.path.isdir(os.path.join(repo_path, project, '.git')):
+                    yield os.path.join(repo_path, project)
+                else:
+                    yield from self.recurse(os.path.join(repo_path, project))
+
+
+    def recurse(self, repo_path):
+        for repo in sorted(os.listdir(repo_path)):
+            yield os.path.join(repo_path, repo)
+
+
+    def enqueue(self, paths):
+        """Queue a background refresh of the given repositories for
+        analyze_worker. Repositories seen for the first time are registered so
+        that the workers can find them."""
+        queued = 0
+        for repo_path in paths:
+            try:
+                repo = Repo(repo_path)
+            except Exception:
+                print(f'  ✗ Not a valid git repository: {repo_path}')
+                continue
+            project = self.get_project(repo_path)
+            repository, _ = self.get_repository(repo, repo_path, project)
+            if project.skip or repository.skip:
+                continue
+            AnalysisJob.enqueue(repository, AnalysisJob.REFRESH, 0, AnalysisJob.REFRESH_PRIORITY, push=False)
+            queued += 1
+        print(f'Queued {queued} of {len(paths)} repositories')
+
+
+    def import_parallel(self, paths, jobs, repo_options):
+        """Analyze the given repositories with a pool of worker processes.
+        Each worker opens its own database connection, the parent only collects
+        the per repository results.
+        Args: paths: list of repository paths
+              jobs: number of worker processes
+              repo_options: keyword arguments for import_repo
+        Returns: list of (path, status, message) tuples"""
+        self.prepare_workers(paths)
+        results = []
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as pool:
+            futures = {pool.submit(import_worker, path, repo_options): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append((futures[future], FAILED, str(e)[:500]))
+        return results
+
+
+
+    def import_pipelined(self, paths, fetch_jobs, jobs, repo_options):
+        """Fetch the given repositories on a pool of threads, fetch_jobs at a
+        time, and analyze each one as soon as its fetch completes, either here
+        or on a pool of jobs worker processes.
+        Returns: list of (path, status, message) tuples"""
+        fetch_options = {key: repo_options[key] for key in ('skip_fetch_hours', 'fetch_timeout', 'fetch_retries')}
+        unwanted = self.unwanted_repos(paths, repo_options['skip_analysis_hours'])
+        results = []
+        analyses = {}
 
+        workers = None
+        if jobs > 1:
+            self.prepare_workers(paths)
+            # The fetch threads are already running when the pool starts its
+            # processes, forking then could copy a lock held by one of them
+            workers = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                          mp_context=multiprocessing.get_context('forkserver'))
 
-    def recurse(self, repo_path, timestamp, no_fetch=False, skip_blame=False, skip_fetch_hours=24, skip_analysis_hours=24):
-        for repo in os.listdir(repo_path):
-            self.import_repo(os.path.join(repo_path, repo), timestamp, no_fetch, skip_blame, skip_fetch_hours, skip_analysis_hours)
+        def analyze(path, fetch_error=None):
+            options = dict(repo_options, no_fetch=True, fetch_error=fetch_error)
+            if workers:
+                analyses[workers.submit(import_worker, path, options)] = path
+            else:
+                results.append(self.import_repo(path, **options))
+
+        with ThreadPoolExecutor(max_workers=fetch_jobs) as fetchers:
+            fetches = [fetchers.submit(fetch_worker, path, **fetch_options) for path in paths if path not in unwanted]
+            # These will be skipped, there is no point in fetching them
+            for path in paths:
+                if path in unwanted:
+                    analyze(path)
+            for future in as_completed(fetches):
+                analyze(*future.result())
+
+        if workers:
+            with workers:
+                for future in as_completed(analyses):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        results.append((analyses[future], FAILED, str(e)[:500]))
+        return results
+
+
+    def unwanted_repos(self, paths, skip_analysis_hours):
+        """Find the paths that import_repo is going to skip without looking
+        at the repository, so that the fetch stage can leave them alone."""
+        names = {os.path.basename(os.path.normpath(path)): path for path in paths}
+        repositories = Repository.objects.filter(name__in=names).select_related('project')
+        unwanted = set()
+        for repository in repositories:
+            recent = (skip_analysis_hours > 0 and repository.last_fetch
+                      and timezone.now() - repository.last_fetch < timedelta(hours=skip_analysis_hours))
+            if repository.skip or repository.project.skip or recent:
+                unwanted.add(names[repository.name])
+        return unwanted
+
+
+    def prepare_workers(self, paths):
+        # Project names are not unique, create them before the workers race
+        for path in paths:
+            self.get_project(path)
+
+        # Connections must not be shared with the forked workers
+        connections.close_all()
+
+
+    def refresh_stats(self, results):
+        """Recompute lines and contributors of the repositories that were
+        analyzed successfully, and of their projects, from Contrib. This runs
+        once at the end instead of aggregating the whole project after each of
+        its repositories: one GROUP BY per level and a bulk_update each.
+        Args: results: list of (path, status, message) tuples of import_repo"""
+        paths = [os.path.abspath(path) for path, status, message in results if status == SUCCESS]
+        if not paths:
+            return
+        repositories = list(Repository.objects.filter(path__in=paths))
+        projects = list(Project.objects.filter(repository__in=repositories).distinct())
+
+        for objects, key in ((repositories, 'repository'), (projects, 'repository__project')):
+            stats = Contrib.objects.filter(**{f'{key}__in': objects}).values(key)\
+                .annotate(lines=models.Sum('count'), contributors=models.Count('author', distinct=True))
+            stats = {row[key]: row for row in stats}
+            for obj in objects:
+                obj.lines = stats.get(obj.pk, {}).get('lines') or 0
+                obj.contributors = stats.get(obj.pk, {}).get('contributors', 0)
+
+        with transaction.atomic():
+            Repository.objects.bulk_update(repositories, ['lines', 'contributors'], batch_size=500)
+            Project.objects.bulk_update(projects, ['lines', 'contributors'], batch_size=500)
+        Generation.bump()
+        print(f'Updated the stats of {len(repositories)} repositories in {len(projects)} projects')
 
 
+    def report(self, results):
+        """Print a summary of the analysis run"""
+        if len(results) < 2:
+            return
+        
+        counts = {SUCCESS: 0, SKIPPED: 0, FAILED: 0}
+        print(f'\nAnalyzed {len(results)} repositories:')
+        for path, status, message in sorted(results):
+            counts[status] += 1
+            print(f'  {SYMBOLS[status]} {path}: {message}')
+        print(f'{counts[SUCCESS]} succeeded, {counts[SKIPPED]} skipped, {counts[FAILED]} failed')
+
     
-    def import_repo(self, repo_path, timestamp, no_fetch=False, skip_blame=False, skip_fetch_hours=24, skip_analysis_hours=24):
+    def import_repo(self, repo_path, timestamp, no_fetch=False, skip_blame=False, skip_fetch_hours=24, skip_analysis_hours=24,
+                    batch_size=1000, lines_engine=BLAME, lines_validate=0, blame_workers=1,
+                    max_blob_size=MAX_BLOB_SIZE, excludes=EXCLUDES, skip_attributes=SKIP_ATTRIBUTES,
+                    binary_check=True, fetch_timeout=300, fetch_retries=2,
+                    fetch_error=None):
+        """Analyze a single repository.
+        When the fetch stage has already run, no_fetch is set and fetch_error
+        holds its error, if any.
+        Returns: (path, status, message) tuple summarizing the outcome"""
         if 'depricated' in repo_path:
-            return
+            return (repo_path, SKIPPED, 'deprecated')
         
         print(f"Analyzing: {repo_path}")
+        reset_peak_rss()
         
         if not os.path.exists(repo_path):
             print(f'  ⚠ Repository not found: {repo_path}')
-            return
+            return (repo_path, FAILED, 'not found')
             
         try:
             repo = Repo(repo_path)
         except Exception as e:
             print(f'  ✗ Not a valid git repository: {e}')
-            return
+            return (repo_path, SKIPPED, 'not a git repository')
 
         project = self.get_project(repo_path)
         if project.skip:
-            return
+            return (repo_path, SKIPPED, 'project skipped')
         
-        repo_name = os.path.basename(os.path.normpath(repo_path))
-        if repo.remotes:
-            url = repo.remotes.origin.url
-        else:
-            url = repo_path
-
-        repository, created = Repository.objects.update_or_create(
-            name=repo_path.split('/')[-1],
-            defaults={'name': repo_name, 'url': url, 'project': project},
-        )
+        repository, created = self.get_repository(repo, repo_path, project)
         if repository.skip:
-            return
+            return (repo_path, SKIPPED, 'repository skipped')
             
         # Skip reprocessing if analyzed within configured hours (0 to disable)
         if skip_analysis_hours > 0 and repository.last_fetch and not created:
@@ -94,135 +360,354 @@ class Command(BaseCommand):
                 hours_ago = int(time_since_analysis.total_seconds() // 3600)
                 mins_ago = int((time_since_analysis.total_seconds() % 3600) // 60)
                 print(f'  ⏭ Skipping (analyzed {hours_ago}h {mins_ago}m ago)')
-                return
+                return (repo_path, SKIPPED, f'analyzed {hours_ago}h {mins_ago}m ago')
         
         try:
-            if not no_fetch:
-                should_fetch = True
-                
-                # Skip fetch if the last commit in the repo is recent enough
-                if skip_fetch_hours > 0:
-                    try:
-                        last_commit_time = get_last_modified_time(repo_path)
-                        if last_commit_time:
-                            time_since_commit = timezone.now() - last_commit_time
-                            if time_since_commit < timedelta(hours=skip_fetch_hours):
-                                hours_ago = int(time_since_commit.total_seconds() // 3600)
-                                print(f'    Skipping fetch (last commit {hours_ago}h ago)')
-                                should_fetch = False
-                    except:
-                        pass  # If we can't determine last commit time, fetch anyway
-                
-                if should_fetch:
-                    print(f'    Fetching updates...')
-                    repo.remotes.origin.fetch()
+            if fetch_error:
+                return self.failed(repository, repo_path, fetch_error)
+            if not no_fetch and should_fetch(repo_path, skip_fetch_hours):
+                print(f'    Fetching updates...')
+                fetch(repo, fetch_timeout, fetch_retries)
             
+            # Nothing to do if no ref moved since the last successful run,
+            # unless lines are wanted now and have not been counted yet, were
+            # counted with other filters, or at an older head (a --skip-blame
+            # run took in the commits since).
+            fingerprint = ref_fingerprint(repo)
+            lines_counted = (repository.blame_commit and repository.lines_engine == lines_engine
+                             and repository.lines_filters == filters_digest(max_blob_size, excludes, skip_attributes,
+                                                                            binary_check)
+                             and repository.blame_commit == repo.commit(get_default_branch(repo)).hexsha)
+            if (timestamp is None and repository.success and fingerprint == repository.ref_fingerprint
+                    and (skip_blame or lines_counted)):
+                print('  ⏭ Skipping (no refs changed)')
+                repository.last_fetch = timezone.now()
+                repository.save(update_fields=['last_fetch'])
+                return (repo_path, SKIPPED, 'no refs changed')
 
-            if timestamp is None:
-                timestamp = repository.last_fetch
-            else:                        
-                timestamp = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+            if timestamp is not None:
+                timestamp = timezone.make_aware(datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S'))
 
-            self.log_commits(timestamp, repo, repository)
+            self.log_commits(timestamp, repo, repository, batch_size)
             
             if skip_blame:
-                total = 0
                 print('    Skipping line count (--skip-blame)')
             else:
-                # Estimate file count to warn about memory usage
-                try:
-                    branch = repo.active_branch.name if not repo.head.is_detached else 'HEAD'
-                    file_count = sum(1 for item in repo.tree(branch).traverse() if item.type == 'blob')
-                    if file_count > 5000:
-                        print(f'    ⚠ Warning: {file_count} files detected. This may cause OOM. Consider using --skip-blame')
-                except:
-                    pass
-                    
-                total = self.line_counts(repo, repository)
+                repository.lines = self.line_counts(repo, repository, lines_engine, lines_validate, blame_workers,
+                                                    max_blob_size, excludes, skip_attributes, binary_check)
                 
             timestamp = get_last_modified_time(repo_path)
 
-            # Recalculate project stats from database (don't accumulate)
-            project.lines = Contrib.objects.filter(repository__project=project).aggregate(total=models.Sum('count'))['total'] or 0
-            project.contributors = Contrib.objects.filter(repository__project=project).values('author').distinct().count()
+            # Project lines and contributors are recomputed by refresh_stats
+            # once all repositories are done
             if project.last_fetch is None or project.last_fetch < timestamp:
                 project.last_fetch = timestamp
-            project.save()
+                project.save(update_fields=['last_fetch'])
 
-            repository.lines = total
-            repository.contributors = Contrib.objects.filter(repository=repository).values('author').distinct().count()
             repository.last_fetch = timezone.now()  # Set to current time, not last commit time
             repository.success = True
+            repository.ref_fingerprint = fingerprint
             repository.save()
-            print(f'  ✓ Success: {total} lines, {repository.contributors} contributors')
+            Generation.bump()
+            summary = f'{repository.lines} lines, {repository.contributors} contributors, peak RSS {peak_rss():.0f} MB'
+            print(f'  ✓ Success: {summary}')
             
             # Force garbage collection after each repo to prevent memory buildup
             del repo
             gc.collect()
+            return (repo_path, SUCCESS, summary)
             
         except (GitCommandError, BadName, ValueError) as ge:
-            print(f"  ✗ Error analyzing repository {repo_path}: {ge}")
-            repository.success = False
-            repository.message = str(ge)[:500]  # Store first 500 chars of error
-            repository.save()
+            return self.failed(repository, repo_path, str(ge))
         except Exception as e:
             print(e)
             import traceback
             traceback.print_exc()
             raise e
 
+
+    def get_repository(self, repo, repo_path, project):
+        """Returns: tuple of the Repository for the path and whether it was created"""
+        repo_name = os.path.basename(os.path.normpath(repo_path))
+        if repo.remotes:
+            url = repo.remotes.origin.url
+        else:
+            url = repo_path
+
+        defaults = {'name': repo_name, 'url': url, 'path': os.path.abspath(repo_path), 'project': project}
+        repository, created = Repository.objects.get_or_create(name=repo_path.split('/')[-1], defaults=defaults)
+        # Only write what changed, an unchanged repository must not make the cached responses stale
+        changed = [field for field in ('name', 'url', 'path') if getattr(repository, field) != defaults[field]]
+        if repository.project_id != project.id:
+            changed.append('project')
+        if changed and not created:
+            for field in changed:
+                setattr(repository, field, defaults[field])
+            repository.save(update_fields=changed)
+            Generation.bump()
+        return repository, created
+
+
+    def failed(self, repository, repo_path, message):
+        print(f"  ✗ Error analyzing repository {repo_path}: {message}")
+        repository.success = False
+        repository.message = message[:500]  # Store first 500 chars of error
+        repository.save()
+        # Commits may have been saved before the error
+        Generation.bump()
+        return (repo_path, FAILED, repository.message)
+
     
-    def log_commits(self, timestamp, repo, repository):
+    def log_commits(self, timestamp, repo, repository, batch_size=1000):
         """Log commits to the database.
-        The last 100,000 commits across all branches are processed in batches.
-        Args: timestamp: datetime of the last commit previously seen
+        Only the commits reachable from the current ref tips but not from the
+        tips seen by the previous run are read, from a single git log stream,
+        and saved in batches, one transaction per batch. The daily rollup of
+        the repository is then counted again from the earliest day read.
+        Args: timestamp: if given, only commits newer than this are saved and
+                         the whole history is checked for them
                 repo: git.Repo object
                 repository: Repository object (database model)
-        Returns: datetime of the last commit processed
+                batch_size: number of commits written per transaction
+        Returns: tuple of the number of commits inserted and skipped
         """
-        batch_size = 1000
-        commit_count = 0
+        inserted = skipped = 0
+        earliest = None
+        batch = []
+
+        tips = ref_tips(repo)
+        if not tips:
+            return inserted, skipped
+        revisions = list(tips)
+        if timestamp is None:
+            # Old tips may have been force pushed away and pruned since
+            revisions += [f'^{sha}' for sha in existing_objects(repo, repository.ref_tips)]
         
-        for commit in repo.iter_commits(all=True, max_count=100000):
-            if timestamp is None or commit.committed_datetime > timestamp:
-                author = Author.get_or_create(commit.author.name)
-
-                with transaction.atomic():
-                    commit, _ = Commit.objects.get_or_create(
-                        hash=commit.hexsha,
-                        defaults = {'hash': commit.hexsha, 'author': author, 
-                                    'timestamp': commit.committed_datetime, 
-                                    'repository': repository, 'message': commit.message}
-                    )
-                
-                commit_count += 1
-                if commit_count % batch_size == 0:
-                    print(f'    Processed {commit_count} commits...')
-            else:
-                break
-            
+        for entry in iter_log(repo, revisions=revisions):
+            if timestamp is not None and entry.committed_datetime <= timestamp:
+                # Commit dates are not ordered across branches, keep looking
+                continue
+
+            batch.append(entry)
+            if earliest is None or entry.committed_datetime < earliest:
+                earliest = entry.committed_datetime
+            if len(batch) == batch_size:
+                saved = self.save_commits(batch, repository)
+                inserted += saved
+                skipped += len(batch) - saved
+                batch = []
+
+        if batch:
+            saved = self.save_commits(batch, repository)
+            inserted += saved
+            skipped += len(batch) - saved
 
+        if earliest is not None:
+            # Commits read but skipped may be left over from a failed run
+            DailyCommits.refresh(repository, timezone.localtime(earliest).date())
 
-    def line_counts(self, repo, repository):
-        """Count lines of code by author in the given repository
+        # Saved with the rest of the repository once the analysis succeeds
+        repository.ref_tips = tips
+        return inserted, skipped
+
+
+    def save_commits(self, batch, repository):
+        """Insert a batch of log entries with a single bulk insert.
+        Commits that are already known (possibly from another repository that
+        shares the history) are left alone.
+        Args: batch: list of LogEntry tuples
+              repository: Repository object (database model)
+        Returns: the number of commits inserted"""
+        with transaction.atomic():
+            existing = set(Commit.objects.filter(hash__in=[entry.hexsha for entry in batch])
+                                         .values_list('hash', flat=True))
+            entries = [entry for entry in batch if entry.hexsha not in existing]
+            authors = author_cache.resolve(entry.author_name for entry in entries)
+            commits = [
+                Commit(hash=entry.hexsha, author=authors[entry.author_name],
+                       timestamp=entry.committed_datetime, repository=repository,
+                       message=entry.message)
+                for entry in entries
+            ]
+            # A concurrent run may have added some of them in the meantime
+            Commit.objects.bulk_create(commits, ignore_conflicts=True)
+
+        print(f'    Saved batch of {len(batch)} commits: {len(commits)} inserted, {len(batch) - len(commits)} skipped')
+        return len(commits)
+
+
+    def line_counts(self, repo, repository, engine=BLAME, validate=0, workers=1, max_size=MAX_BLOB_SIZE,
+                    excludes=EXCLUDES, attributes=SKIP_ATTRIBUTES, sniff=True):
+        """Count lines of code by author in the given repository.
+        Results are stored per file, so only the files added or modified since
+        repository.blame_commit are counted again and the files that were
+        deleted are dropped. The totals are rebuilt from the stored counts.
         
         Args: repo: git.Repo object
               repository: Repository object (database model)
-        Returns: total number of lines in the git repository"""
+              engine: BLAME runs git blame on every changed file, REPLAY builds
+                      the owner of every line by replaying the first parent
+                      history instead, which is much cheaper but attributes
+                      lines brought in by a merge to the author of the merge
+              validate: number of files to check against git blame
+              workers: number of files blamed at the same time
+              max_size, excludes, attributes, sniff: which files to skip, see filter_files
+        Returns: total number of lines in the git repository, the number of
+        authors is left in repository.contributors"""
+
+        head = repo.commit(get_default_branch(repo)).hexsha
+        # Blobs counted before are text, there is no need to read them again
+        text_blobs = set(BlameFile.objects.filter(repository=repository).values_list('blob', flat=True))
+        blobs, skipped = list_blobs(repo, head, max_size, excludes, text_blobs, attributes, sniff)
+        repository.files = len(blobs)
+        repository.skipped_files = skipped
+        print(f"    {len(blobs)} files to count, skipped {', '.join(f'{n} by {reason}' for reason, n in skipped.items())}")
+        if engine == BLAME and len(blobs) > 5000:
+            print(f'    ⚠ Warning: {len(blobs)} files detected. This may take a while. Consider using --skip-blame')
 
-        lines_by_author = count_lines_by_author(repo)
-        total = 0
+        if repository.lines_engine != engine:
+            # Stored results of the other engine cannot be built upon
+            BlameFile.objects.filter(repository=repository).delete()
+            repository.blame_commit = ''
+            repository.lines_engine = engine
+            repository.save(update_fields=['blame_commit', 'lines_engine'])
 
+        if engine == REPLAY:
+            files, deleted = self.replay_changes(repo, repository, head, blobs)
+        else:
+            files, deleted = self.blame_changes(repo, repository, head, blobs, workers)
+        # Including files that are now excluded
+        deleted |= set(BlameFile.objects.filter(repository=repository).values_list('path', flat=True)) - set(blobs)
+
+        with transaction.atomic():
+            deleted = list(deleted)
+            for i in range(0, len(deleted), 500):
+                BlameFile.objects.filter(repository=repository, path__in=deleted[i:i + 500]).delete()
+            BlameFile.objects.bulk_create(files, batch_size=500, update_conflicts=True,
+                                          unique_fields=['repository', 'path'],
+                                          update_fields=['blob', 'counts', 'owners'])
+            repository.blame_commit = head
+            repository.lines_filters = filters_digest(max_size, excludes, attributes, sniff)
+            repository.save(update_fields=['blame_commit', 'lines_filters'])
+
+        if validate:
+            self.validate_lines(repo, repository, head, validate)
+
+        lines_by_author = {}
+        for counts in BlameFile.objects.filter(repository=repository).values_list('counts', flat=True).iterator():
+            for commiter, count in counts.items():
+                lines_by_author[commiter] = lines_by_author.get(commiter, 0) + count
+
+        authors = author_cache.resolve(lines_by_author)
+        counts = Counter()
         for commiter, count in lines_by_author.items():
-            author = Author.get_or_create(commiter)
-            Contrib.objects.update_or_create(
-                author=author, 
-                repository=repository,
-                defaults={'count': count}
-            )
-            total += count
-        
-        return total
+            # Several names can be aliases of one author
+            counts[authors[commiter].id] += count
+
+        with transaction.atomic():
+            Contrib.objects.bulk_create(
+                (Contrib(author_id=author, repository=repository, count=count) for author, count in counts.items()),
+                batch_size=500, update_conflicts=True, unique_fields=['author', 'repository'], update_fields=['count'])
+            # Authors whose lines have all been replaced or deleted
+            Contrib.objects.filter(repository=repository).exclude(author__in=list(counts)).delete()
+
+        repository.contributors = len(counts)
+        return sum(counts.values())
+
+
+    def blame_changes(self, repo, repository, head, blobs, workers=1):
+        """Blame the files that changed since repository.blame_commit.
+        Returns: tuple of the BlameFile objects to save and the deleted paths"""
+        stored = dict(BlameFile.objects.filter(repository=repository).values_list('path', 'blob'))
+
+        changes = None
+        if repository.blame_commit and stored:
+            changes = changed_paths(repo, repository.blame_commit, head)
+        if changes is None:
+            changed, deleted = set(blobs), set(stored) - set(blobs)
+        else:
+            changed, deleted = changes
+            print(f'    {len(changed)} files changed and {len(deleted)} deleted since {repository.blame_commit[:8]}')
+            # Files that were excluded before but are not anymore
+            changed |= set(blobs) - set(stored)
+
+        # Unchanged blobs (a file that was modified and then reverted) keep their counts
+        paths = sorted(path for path in changed if path in blobs and stored.get(path) != blobs[path])
+        files = [
+            BlameFile(repository=repository, path=path, blob=blobs[path], counts=counts)
+            for path, counts in blame_files(repo, head, paths, workers)
+        ]
+        return files, deleted
+
+
+    def replay_changes(self, repo, repository, head, blobs):
+        """Replay the first parent history since repository.blame_commit on
+        top of the stored line owners.
+        Returns: tuple of the BlameFile objects to save and the deleted paths"""
+        old = repository.blame_commit or None
+        if old and not self.is_ancestor(repo, old, head):
+            print(f'    {old[:8]} is no longer in the history, replaying from the start')
+            BlameFile.objects.filter(repository=repository).delete()
+            old = None
+
+        def load(path):
+            owners = BlameFile.objects.filter(repository=repository, path=path).values_list('owners', flat=True).first()
+            return decode_owners(owners) if owners else None
+
+        touched = {} if old == head else replay_ownership(repo, old, head, load if old else lambda path: None)
+        if old:
+            # Files that were excluded before but are not anymore have no
+            # owners to build upon, they are blamed instead of replaying the
+            # whole history for them. Files added since old are not among
+            # them, they were replayed in full.
+            stored = set(BlameFile.objects.filter(repository=repository).values_list('path', flat=True))
+            missing = set(blobs) - stored
+            if missing:
+                missing &= {f.path for f in list_files(repo, old)}
+            if missing:
+                print(f'    Blaming {len(missing)} files without stored owners')
+                for path in sorted(missing):
+                    touched[path] = blame_owners(repo, head, path)
+
+        files, deleted = [], set()
+        for path, owners in touched.items():
+            if owners is None or path not in blobs:
+                deleted.add(path)
+            else:
+                files.append(BlameFile(repository=repository, path=path, blob=blobs[path],
+                                       counts=dict(Counter(owners)), owners=encode_owners(owners)))
+        print(f'    Replayed {len(files)} changed files and {len(deleted)} deletions')
+        return files, deleted
+
+
+    def is_ancestor(self, repo, old, new):
+        try:
+            return repo.is_ancestor(old, new)
+        except GitCommandError:
+            return False
+
+
+    def validate_lines(self, repo, repository, head, sample):
+        """Compare the stored line counts with git blame on a random sample of files"""
+        files = list(BlameFile.objects.filter(repository=repository).values_list('path', 'counts'))
+        files = random.sample(files, min(sample, len(files)))
+        identical = agreed = total = 0
+
+        for path, counts in files:
+            try:
+                blamed = blame_file(repo, head, path)
+            except GitCommandError:
+                continue
+            if blamed == counts:
+                identical += 1
+            else:
+                print(f'      ≠ {path}: {counts} but blame says {blamed}')
+            agreed += sum(min(count, counts.get(author, 0)) for author, count in blamed.items())
+            total += sum(blamed.values())
+
+        percent = 100 * agreed / total if total else 100
+        print(f'    Validation: {identical}/{len(files)} files identical, '
+              f'{agreed}/{total} blamed lines agree ({percent:.1f}%)')
 
     def get_project(self, repo_path):
         path = os.path.normpath(repo_path)
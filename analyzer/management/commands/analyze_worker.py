@@ -0,0 +1,113 @@
+"""
+A Django management command that drains the AnalysisJob queue. Any number of
+workers, on any host that shares the database, can run at the same time:
+
+    python manage.py analyze_worker
+    python manage.py analyze_worker --once --skip-blame
+
+Jobs are queued by the push webhook and by analyze --enqueue.
+"""
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection
+
+from analyzer.management.commands.analyze import Command as AnalyzeCommand, FAILED, SKIPPED, SUCCESS, SYMBOLS
+from analyzer.models import AnalysisJob
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease of a job until it is stopped"""
+
+    def __init__(self, job, worker, lease):
+        super().__init__(daemon=True)
+        self.job = job
+        self.worker = worker
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.lease.total_seconds() / 3):
+                if not self.job.renew(self.worker, self.lease):
+                    print(f'  ⚠ Lost the lease of job {self.job.id}')
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Command(AnalyzeCommand):
+    help = 'Analyze the repositories queued as AnalysisJobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', type=str, default=f'{socket.gethostname()}:{os.getpid()}',
+                            help='Name recorded on claimed jobs (default: host:pid)')
+        parser.add_argument('--lease', type=int, default=300,
+                            help='Seconds a job stays claimed without a heartbeat (default: 300)')
+        parser.add_argument('--max-attempts', type=int, default=3,
+                            help='Number of leases a job may run out before it is failed (default: 3)')
+        parser.add_argument('--poll', type=int, default=10, help='Seconds to wait when the queue is empty (default: 10)')
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due instead of waiting')
+        self.add_analysis_arguments(parser)
+
+    def handle(self, *args, **options):
+        worker = options['worker_id']
+        lease = timedelta(seconds=options['lease'])
+        repo_options = self.analysis_options(options)
+        # Each job prints its own result, a worker that runs for months only
+        # keeps the number of each outcome
+        counts = Counter()
+
+        print(f'Worker {worker} waiting for jobs')
+        while True:
+            job = AnalysisJob.claim(worker, lease, options['max_attempts'])
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+                continue
+            _, status, _ = self.run_job(job, worker, lease, repo_options)
+            counts[status] += 1
+
+        print(f'{counts[SUCCESS]} succeeded, {counts[SKIPPED]} skipped, {counts[FAILED]} failed')
+
+    def run_job(self, job, worker, lease, repo_options):
+        """Analyze the repository of a claimed job while a heartbeat keeps
+        the lease alive.
+        Returns: (path, status, message) tuple"""
+        print(f'Job {job.id} (priority {job.priority}, attempt {job.attempts}): '
+              f'{job.pushes} push(es) to {job.repository.name} from {job.source}')
+        if job.pushes:
+            # A push means there is something new, whatever the age of the last run
+            repo_options = dict(repo_options, skip_fetch_hours=0, skip_analysis_hours=0)
+
+        heartbeat = Heartbeat(job, worker, lease)
+        heartbeat.start()
+        try:
+            if job.repository.path:
+                result = self.import_repo(job.repository.path, **repo_options)
+            else:
+                result = (job.repository.name, FAILED, 'path unknown, analyze the repository once by path')
+        except Exception as e:
+            result = (job.repository.path, FAILED, str(e)[:500])
+        except BaseException:
+            # Interrupted, let another worker have it
+            job.release(worker)
+            raise
+        finally:
+            heartbeat.stop()
+
+        status = AnalysisJob.FAILED if result[1] == FAILED else AnalysisJob.DONE
+        job.finish(worker, status, result[2])
+        print(f'  {SYMBOLS[result[1]]} Job {job.id}: {result[2]}')
+        # A worker never finishes its run, the stats are refreshed per job
+        self.refresh_stats([result])
+        return result
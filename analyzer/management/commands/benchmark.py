@@ -0,0 +1,194 @@
+"""
+A Django management command to time the hot paths of the analyzer against
+real data, so that changes to them can be compared with the code they replace.
+
+    python manage.py benchmark log /path/to/repo
+    python manage.py benchmark active_per_week --projects 1 10 50
+    python manage.py benchmark formats --authors 100
+    python manage.py benchmark load http://localhost:8000/api/commits/by_author/ --clients 100
+"""
+import random
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from git import Repo
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncWeek
+from django.test import Client
+from django.utils import timezone
+
+from analyzer.importer import iter_log
+from analyzer.models import Author, Commit, DailyCommits, Project, Repository
+from analyzer.views import activity_rows, weekly_activity
+
+
+def measure(label, func):
+    """Run func once and print its wall clock time and peak Python allocations.
+    Returns: whatever func returned"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'  {label:<24} {elapsed:8.3f}s  peak {peak / 1024 / 1024:8.1f} MB')
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark analyzer internals'
+
+    def add_arguments(self, parser):
+        targets = parser.add_subparsers(dest='target', required=True)
+
+        log = targets.add_parser('log', help='GitPython iter_commits against the streaming git log parser')
+        log.add_argument('location', type=str)
+        log.add_argument('--max-count', type=int, default=100000)
+
+        active = targets.add_parser('active_per_week',
+                                    help='active_per_week on the commit table against the single rollup query, '
+                                         'on generated data that is rolled back afterwards')
+        active.add_argument('--projects', type=int, nargs='+', default=[1, 10, 50])
+        active.add_argument('--authors', type=int, default=20, help='Authors per project (default: 20)')
+        active.add_argument('--days', type=int, default=365, help='Days of history per project (default: 365)')
+        active.add_argument('--commits-per-day', type=int, default=5, help='Commits per project and day (default: 5)')
+
+        formats = targets.add_parser('formats', help='Size and time of the chart endpoints as lists of objects '
+                                                     'and in the columnar format, on generated data that is rolled back')
+        formats.add_argument('--projects', type=int, default=50)
+        formats.add_argument('--authors', type=int, default=100, help='Authors per project (default: 100)')
+        formats.add_argument('--days', type=int, default=30, help='Days of history per project (default: 30)')
+        formats.add_argument('--commits-per-day', type=int, default=20, help='Commits per project and day (default: 20)')
+
+        load = targets.add_parser('load', help='Requests per second and latency of URLs of a running server '
+                                               'under concurrent clients')
+        load.add_argument('urls', type=str, nargs='+')
+        load.add_argument('--clients', type=int, default=100, help='Concurrent clients (default: 100)')
+        load.add_argument('--requests', type=int, default=2000, help='Requests per URL (default: 2000)')
+        load.add_argument('--bust-cache', action='store_true',
+                          help='Make every URL unique so that the response cache is never hit')
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['target']}")(options)
+
+    def bench_log(self, options):
+        repo = Repo(options['location'])
+        max_count = options['max_count']
+
+        def gitpython():
+            count = 0
+            for commit in repo.iter_commits(all=True, max_count=max_count):
+                # The fields log_commits used to read from each commit
+                commit.hexsha, commit.author.name, commit.committed_datetime, commit.message
+                count += 1
+            return count
+
+        def streaming():
+            count = 0
+            for entry in iter_log(repo, '--all', f'--max-count={max_count}'):
+                count += 1
+            return count
+
+        print(f"Reading up to {max_count} commits from {options['location']}")
+        before = measure('iter_commits', gitpython)
+        after = measure('iter_log', streaming)
+        print(f'  {before} commits with iter_commits, {after} with iter_log')
+
+    def bench_active_per_week(self, options):
+        for count in options['projects']:
+            with transaction.atomic():
+                projects = self.generate_projects(count, options['authors'], options['days'], options['commits_per_day'])
+                print(f'{count} project(s), {Commit.objects.count()} commits, {DailyCommits.objects.count()} rollup rows')
+                before = measure('commit table', lambda: legacy_active_per_week(projects, 90, 52))
+                today = timezone.localdate()
+                after = measure('rollup, one query',
+                                lambda: weekly_activity(list(activity_rows(projects, 90, 52, today)), 90, 52, today))
+                print(f'  {len(before)} author weeks with data, {len(after["weeks"])} x {len(after["authors"])} matrix')
+                transaction.set_rollback(True)
+
+    def bench_formats(self, options):
+        client = Client(SERVER_NAME='localhost')
+        with transaction.atomic():
+            self.generate_projects(options['projects'], options['authors'], options['days'], options['commits_per_day'])
+            print(f'{Author.objects.count()} authors, {Repository.objects.count()} repositories, '
+                  f'{Commit.objects.count()} commits')
+            client.get('/api/commits/by_project/')  # import and URL resolution
+            for action in ('by_author', 'by_repository'):
+                for format in ('json', 'columnar'):
+                    caches['api'].clear()
+                    url = f"/api/commits/{action}/?days={options['days']}&format={format}"
+                    content = measure(f'{action} {format}', lambda: client.get(url).content)
+                    print(f'  {"":<24} {len(content) / 1024:8.1f} KB')
+            transaction.set_rollback(True)
+
+    def bench_load(self, options):
+        clients, count = options['clients'], options['requests']
+
+        def get(number):
+            url = urls[number % len(urls)]
+            start = time.perf_counter()
+            with urllib.request.urlopen(url, timeout=60) as answer:
+                answer.read()
+            return time.perf_counter() - start
+
+        for url in options['urls']:
+            urls = [url]
+            if options['bust_cache']:
+                separator = '&' if '?' in url else '?'
+                urls = [f'{url}{separator}_={number}' for number in range(count)]
+            get(0)
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                start = time.perf_counter()
+                latencies = sorted(executor.map(get, range(count)))
+                elapsed = time.perf_counter() - start
+            print(f'{url}\n  {count} requests, {clients} clients: {count / elapsed:8.1f} rps, '
+                  f'p50 {latencies[count // 2] * 1000:7.1f} ms, p99 {latencies[int(count * 0.99)] * 1000:7.1f} ms')
+
+    def generate_projects(self, count, authors, days, commits_per_day):
+        """Create count projects with a repository each, whose authors commit
+        at random over the given number of days.
+        Returns: list of project names"""
+        now = timezone.now()
+        names = []
+        for number in range(count):
+            project = Project.objects.create(name=f'benchmark-{number}')
+            repository = Repository.objects.create(name=f'benchmark-{number}', project=project,
+                                                   url=f'https://example.com/benchmark-{number}.git')
+            people = Author.objects.bulk_create(
+                Author(name=f'Author {number}.{person}', slug=f'benchmark-{number}-{person}') for person in range(authors))
+            Commit.objects.bulk_create(
+                (Commit(hash=f'{number:08x}{commit:032x}', author=random.choice(people), repository=repository,
+                        timestamp=now - timedelta(minutes=random.randrange(days * 24 * 60)), message='')
+                 for commit in range(days * commits_per_day)),
+                batch_size=1000)
+            DailyCommits.refresh(repository)
+            names.append(project.name)
+        return names
+
+
+def legacy_active_per_week(project_list, active_days, weeks_back):
+    """The queries active_per_week used to run against the commit table"""
+    active_cutoff = timezone.now() - timedelta(days=active_days)
+    active_authors = Author.objects.filter(
+        commit__repository__project__name__in=project_list,
+        commit__timestamp__gte=active_cutoff
+    ).distinct()
+    list(active_authors.values_list('name', flat=True).order_by('name'))
+
+    chart_cutoff = timezone.now() - timedelta(weeks=weeks_back)
+    commits = Commit.objects.filter(
+        repository__project__name__in=project_list,
+        author__in=active_authors,
+        timestamp__gte=chart_cutoff
+    ).annotate(week=TruncWeek('timestamp'))
+    by_author = list(commits.values('week', 'author__name').annotate(commits=Count('id')).order_by('week', 'author__name'))
+    list(commits.values('week').annotate(total_commits=Count('id')).order_by('week'))
+    active_authors.count()
+    active_authors.count()
+    return by_author
@@ -7,7 +7,7 @@ class Command(BaseCommand):
 
     def handle(self, *args: Any, **options: Any):
         Project.objects.all().update(lines=0, contributors=0, last_fetch=None)
-        Repository.objects.all().update(lines=0, contributors=0, last_fetch=None, success=True)
+        Repository.objects.all().update(lines=0, contributors=0, last_fetch=None, success=True, blame_commit='', lines_filters='', ref_fingerprint='', ref_tips=[])
         #Commit.objects.all().delete()
         #Contrib.objects.all().delete()
         # Alias.objects.all().delete()
@@ -0,0 +1,33 @@
+"""
+A Django management command to rebuild the DailyCommits rollup from the
+Commit table. analyze keeps the rollup up to date as it saves commits, this
+is for existing databases and for repairs.
+
+    python manage.py rollup
+    python manage.py rollup --repository my-repo --since 2024-01-01
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.models import DailyCommits, Generation, Repository
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily commit counts from the commits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repository', type=str, help='Only rebuild the rollup of the named repository')
+        parser.add_argument('--since', type=date.fromisoformat, help='Only rebuild the days from YYYY-MM-DD on')
+
+    def handle(self, *args, **options):
+        repository = None
+        if options['repository']:
+            try:
+                repository = Repository.objects.get(name=options['repository'])
+            except Repository.DoesNotExist:
+                raise CommandError(f"Repository {options['repository']} not found")
+
+        rows = DailyCommits.refresh(repository, options['since'])
+        Generation.bump()
+        print(f'Wrote {rows} daily commit counts')
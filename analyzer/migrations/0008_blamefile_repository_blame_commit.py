@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0007_repository_message'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='blame_commit',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.CreateModel(
+            name='BlameFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024)),
+                ('blob', models.CharField(max_length=40)),
+                ('counts', models.JSONField(default=dict)),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='analyzer.repository')),
+            ],
+            options={
+                'unique_together': {('repository', 'path')},
+            },
+        ),
+    ]
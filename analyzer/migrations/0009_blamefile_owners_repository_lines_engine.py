@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0008_blamefile_repository_blame_commit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blamefile',
+            name='owners',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='repository',
+            name='lines_engine',
+            field=models.CharField(default='blame', max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0009_blamefile_owners_repository_lines_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='files',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='repository',
+            name='skipped_files',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
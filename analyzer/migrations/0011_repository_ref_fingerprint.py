@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0010_repository_files_repository_skipped_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='ref_fingerprint',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0011_repository_ref_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='ref_tips',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
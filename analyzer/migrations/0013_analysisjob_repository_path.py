@@ -0,0 +1,37 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0012_repository_ref_tips'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=1024),
+        ),
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=20)),
+                ('status', models.CharField(default='pending', max_length=10)),
+                ('pushes', models.IntegerField(default=1)),
+                ('run_after', models.DateTimeField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('message', models.TextField(blank=True, default='')),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='analyzer.repository')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='analyzer_an_status_3d6450_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('repository',), name='one_pending_job_per_repository')],
+            },
+        ),
+    ]
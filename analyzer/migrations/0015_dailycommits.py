@@ -0,0 +1,45 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def build_rollup(apps, schema_editor):
+    """Count the commits that are already in the database"""
+    Commit = apps.get_model('analyzer', 'Commit')
+    DailyCommits = apps.get_model('analyzer', 'DailyCommits')
+    counts = Commit.objects.annotate(day=TruncDate('timestamp'))\
+                           .values('author', 'repository', 'day')\
+                           .annotate(commits=Count('id'))\
+                           .order_by()
+    DailyCommits.objects.bulk_create(
+        (DailyCommits(author_id=row['author'], repository_id=row['repository'], day=row['day'], commits=row['commits'])
+         for row in counts.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0014_analysisjob_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCommits',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('commits', models.IntegerField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='analyzer.author')),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='analyzer.repository')),
+            ],
+            options={
+                'verbose_name_plural': 'daily commits',
+                'unique_together': {('author', 'repository', 'day')},
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
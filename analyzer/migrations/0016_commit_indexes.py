@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0015_dailycommits'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commit',
+            index=models.Index(fields=['timestamp'], name='analyzer_co_timesta_751014_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commit',
+            index=models.Index(fields=['repository', 'timestamp'], name='analyzer_co_reposit_169876_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commit',
+            index=models.Index(fields=['author', 'timestamp'], name='analyzer_co_author__846805_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycommits',
+            index=models.Index(fields=['day'], name='analyzer_da_day_f0b61d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycommits',
+            index=models.Index(fields=['repository', 'day'], name='analyzer_da_reposit_4e9365_idx'),
+        ),
+    ]
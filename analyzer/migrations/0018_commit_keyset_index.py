@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0017_generation'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='commit',
+            name='analyzer_co_timesta_751014_idx',
+        ),
+        migrations.AddIndex(
+            model_name='commit',
+            index=models.Index(fields=['-timestamp', '-id'], name='analyzer_co_timesta_13ed5c_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0018_commit_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='lines_filters',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
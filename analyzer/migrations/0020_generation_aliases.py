@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0019_repository_lines_filters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generation',
+            name='aliases',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
-from django.db.models import F
-from django.db.models.signals import post_save
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest, TruncDate
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.text import slugify
 
 # Create your models here.
@@ -23,9 +27,13 @@ class Author(models.Model):
     def __str__(self):
         return self.name
     
+    @staticmethod
+    def make_slug(name):
+        return slugify(name.strip().lower().replace('.', ' '))
+
     @classmethod
     def get_or_create(cls,name):
-        slug = slugify(name.strip().lower().replace('.', ' '))
+        slug = cls.make_slug(name)
         try:
             return Alias.objects.get(slug=slug).author
         except Alias.DoesNotExist:
@@ -37,16 +45,70 @@ class Alias(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
 
 
+class AuthorCache:
+    """Resolves author names to Author objects the same way as
+    Author.get_or_create but without querying for every name.
+    All aliases and authors are loaded on first use and authors that are not
+    known yet are created in bulk and added to the cache.
+    Aliases saved by another process delete the authors they replace, so the
+    cache is loaded again when Generation.aliases has moved since."""
+
+    def __init__(self):
+        self.authors = None
+        self.aliases = None
+
+    def load(self):
+        self.aliases = Generation.current_aliases()
+        authors = {author.slug: author for author in Author.objects.all()}
+        for alias in Alias.objects.select_related('author'):
+            authors[alias.slug] = alias.author
+        self.authors = authors
+
+    def invalidate(self):
+        self.authors = None
+
+    def resolve(self, names):
+        """Args: names: iterable of author names
+        Returns: dictionary of author names and Author objects"""
+        if self.authors is None or self.aliases != Generation.current_aliases():
+            self.load()
+
+        slugs = {name: Author.make_slug(name) for name in set(names)}
+        missing = {}
+        for name, slug in slugs.items():
+            if slug not in self.authors and slug not in missing:
+                missing[slug] = Author(name=name, slug=slug)
+
+        if missing:
+            # Another process may create the same authors, so read them back
+            Author.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            for author in Author.objects.filter(slug__in=missing.keys()):
+                self.authors[author.slug] = author
+
+        return {name: self.authors[slug] for name, slug in slugs.items()}
+
+
+author_cache = AuthorCache()
+
+
 class Repository(models.Model):
     name = models.CharField(max_length=100, unique=True)
     last_fetch = models.DateTimeField(null=True, blank=True)
     url = models.URLField()
+    path = models.CharField(max_length=1024, blank=True, default='')
     project = models.ForeignKey(Project, on_delete=models.PROTECT)
     lines = models.IntegerField(default=0)
     contributors = models.IntegerField(default=0)
     skip = models.BooleanField(default=False)
     success = models.BooleanField(default=True)
     message = models.TextField(default='')
+    blame_commit = models.CharField(max_length=40, blank=True, default='')
+    ref_fingerprint = models.CharField(max_length=40, blank=True, default='')
+    ref_tips = models.JSONField(default=list, blank=True)
+    lines_engine = models.CharField(max_length=10, default='blame')
+    lines_filters = models.CharField(max_length=40, blank=True, default='')
+    files = models.IntegerField(default=0)
+    skipped_files = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.project.name + '/' + self.name
@@ -59,6 +121,61 @@ class Commit(models.Model):
     repository = models.ForeignKey(Repository, on_delete=models.PROTECT)
     message = models.TextField()
 
+    class Meta:
+        # The API filters commits by a time window, often within one
+        # repository, project or author, and lists them newest first
+        indexes = [
+            models.Index(fields=['-timestamp', '-id']),
+            models.Index(fields=['repository', 'timestamp']),
+            models.Index(fields=['author', 'timestamp']),
+        ]
+
+
+class DailyCommits(models.Model):
+    """The number of commits an author made to a repository on one day.
+    The dashboard endpoints sum these instead of counting Commit rows."""
+    author = models.ForeignKey('Author', on_delete=models.PROTECT)
+    repository = models.ForeignKey(Repository, on_delete=models.PROTECT)
+    day = models.DateField()
+    commits = models.IntegerField()
+
+    class Meta:
+        unique_together = ('author', 'repository', 'day')
+        indexes = [
+            models.Index(fields=['day']),
+            models.Index(fields=['repository', 'day']),
+        ]
+        verbose_name_plural = 'daily commits'
+
+    @classmethod
+    def refresh(cls, repository=None, since=None):
+        """Count the commits again, for one repository and from a day on
+        if given, replacing the rows of that range.
+        Args: repository: Repository object or None for all of them
+              since: datetime.date or None for all days
+        Returns: the number of rows written"""
+        commits = Commit.objects.all()
+        rows = cls.objects.all()
+        if repository is not None:
+            commits = commits.filter(repository=repository)
+            rows = rows.filter(repository=repository)
+        if since is not None:
+            start = datetime.combine(since, time.min, tzinfo=timezone.get_current_timezone())
+            commits = commits.filter(timestamp__gte=start)
+            rows = rows.filter(day__gte=since)
+
+        counts = commits.annotate(day=TruncDate('timestamp'))\
+                        .values('author', 'repository', 'day')\
+                        .annotate(commits=Count('id'))\
+                        .order_by()
+        with transaction.atomic():
+            rows.delete()
+            created = cls.objects.bulk_create(
+                (cls(author_id=row['author'], repository_id=row['repository'], day=row['day'], commits=row['commits'])
+                 for row in counts.iterator()),
+                batch_size=1000)
+        return len(created)
+
 
 class Contrib(models.Model):
     author = models.ForeignKey('Author', on_delete=models.PROTECT)
@@ -67,11 +184,174 @@ class Contrib(models.Model):
 
     class Meta:
         unique_together = ('author', 'repository')
-       
+
+
+class BlameFile(models.Model):
+    """Line counts by author for one file of a repository at
+    repository.blame_commit, as found by the repository.lines_engine. Only
+    files whose blob changed since that commit need to be counted again.
+    The replay engine also keeps the run length encoded author of every line
+    in owners so that later diffs can be applied to it."""
+    repository = models.ForeignKey(Repository, on_delete=models.PROTECT)
+    path = models.CharField(max_length=1024)
+    blob = models.CharField(max_length=40)
+    counts = models.JSONField(default=dict)
+    owners = models.JSONField(default=list)
+
+    class Meta:
+        unique_together = ('repository', 'path')
+
+
+class Generation(models.Model):
+    """A single row counting the changes to the analyzed data. Cached API
+    responses are keyed on it, so bumping it makes all of them stale.
+    aliases only counts the saved aliases, which make the author caches stale."""
+    value = models.BigIntegerField(default=0)
+    aliases = models.BigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+    @classmethod
+    def current_aliases(cls):
+        return cls.objects.filter(pk=1).values_list('aliases', flat=True).first() or 0
+
+    @classmethod
+    async def acurrent(cls):
+        return await cls.objects.filter(pk=1).values_list('value', flat=True).afirst() or 0
+
+    @classmethod
+    def bump(cls, aliases=False):
+        counters = {'value': F('value') + 1}
+        if aliases:
+            counters['aliases'] = F('aliases') + 1
+        if not cls.objects.filter(pk=1).update(**counters):
+            cls.objects.get_or_create(pk=1, defaults={'value': 1, 'aliases': int(aliases)})
+
+
+class AnalysisJob(models.Model):
+    """A request to analyze one repository again, made by a push webhook or
+    by the background refresh (analyze --enqueue) and run by analyze_worker.
+    Pushes that arrive while the job is pending are added to it, so a burst of
+    pushes to the same repository is analyzed once, when run_after is reached.
+
+    A worker claims a job with a lease and renews it while it works. When a
+    worker dies its lease runs out and another worker claims the job again,
+    up to max_attempts times."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    REFRESH = 'refresh'
+    WEBHOOK_PRIORITY = 10
+    REFRESH_PRIORITY = 0
+
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE)
+    source = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, default=PENDING)
+    priority = models.IntegerField(default=0)
+    pushes = models.IntegerField(default=1)
+    run_after = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True, default='')
+    started = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    message = models.TextField(default='', blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'priority', 'run_after'])]
+        constraints = [
+            models.UniqueConstraint(fields=['repository'], condition=Q(status='pending'),
+                                    name='one_pending_job_per_repository'),
+        ]
+
+    def __str__(self):
+        return f'{self.repository.name} ({self.status})'
+
+    @classmethod
+    def enqueue(cls, repository, source, delay, priority=WEBHOOK_PRIORITY, push=True):
+        """Add a push to the pending job of the repository, raising its
+        priority if needed, or create a job that runs delay seconds from now.
+        Returns: the pending AnalysisJob"""
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    pending = cls.objects.filter(repository=repository, status=cls.PENDING)
+                    if pending.update(pushes=F('pushes') + int(push), priority=Greatest('priority', priority)):
+                        return pending.get()
+                    return cls.objects.create(repository=repository, source=source, priority=priority,
+                                              pushes=int(push), run_after=timezone.now() + timedelta(seconds=delay))
+            except IntegrityError:
+                # Another push created the pending job first
+                if attempt:
+                    raise
+
+    @classmethod
+    def claim(cls, worker, lease, max_attempts=3):
+        """Take the most urgent job that is due, or one whose worker let its
+        lease expire. Repositories that another worker is analyzing are left
+        alone. Jobs that already used up max_attempts leases are failed.
+        Args: worker: name of the claiming worker
+              lease: timedelta the job is reserved for
+        Returns: the claimed AnalysisJob or None"""
+        now = timezone.now()
+        expired = Q(status=cls.RUNNING, lease_expires__lt=now)
+        cls.objects.filter(expired, attempts__gte=max_attempts).update(
+            status=cls.FAILED, finished=now, message=f'lease expired {max_attempts} times')
+
+        busy = cls.objects.filter(status=cls.RUNNING, lease_expires__gte=now).values('repository')
+        candidates = cls.objects.filter(Q(status=cls.PENDING, run_after__lte=now) | expired)\
+                                .exclude(repository__in=busy)\
+                                .order_by('-priority', 'run_after')
+        for job in candidates[:10]:
+            # Only one worker can move the job away from what it read
+            claimed = cls.objects.filter(pk=job.pk, status=job.status, lease_expires=job.lease_expires).update(
+                status=cls.RUNNING, worker=worker, attempts=F('attempts') + 1,
+                started=now, heartbeat=now, lease_expires=now + lease)
+            if claimed:
+                job.refresh_from_db()
+                return job
+        return None
+
+    def renew(self, worker, lease):
+        """Extend the lease while the worker is still busy with the job.
+        Returns: False if the lease was lost to another worker"""
+        now = timezone.now()
+        return bool(AnalysisJob.objects.filter(pk=self.pk, worker=worker, status=self.RUNNING).update(
+            heartbeat=now, lease_expires=now + lease))
+
+    def finish(self, worker, status, message=''):
+        """Record the outcome, unless another worker has taken over the job"""
+        AnalysisJob.objects.filter(pk=self.pk, worker=worker, status=self.RUNNING).update(
+            status=status, message=message, finished=timezone.now(), lease_expires=None)
+
+    def release(self, worker):
+        """Give the job up so that another worker can claim it right away"""
+        AnalysisJob.objects.filter(pk=self.pk, worker=worker, status=self.RUNNING).update(
+            lease_expires=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=Repository)
+def bump_generation(sender, instance, update_fields=None, **kwargs):
+    # Also covers the skip flags and names edited in the admin. Saves of
+    # chosen fields are analyze keeping its books, it bumps the generation
+    # itself once the analyzed data has changed.
+    if update_fields is None:
+        Generation.bump()
+
 
 @receiver(post_save, sender=Alias)
 def update_alias(sender, instance, **kwargs):
+    author_cache.invalidate()
+    Generation.bump(aliases=True)
     Contrib.objects.filter(author__slug=instance.slug).delete()
+    DailyCommits.objects.filter(author__slug=instance.slug).delete()
     Commit.objects.filter(author__slug=instance.slug).delete()
     Author.objects.filter(slug=instance.slug).delete()
             
@@ -0,0 +1,151 @@
+"""
+Renderers beyond DRF's JSON and browsable API.
+
+The columnar format of the by_author and by_repository chart endpoints,
+?format=columnar.
+
+Instead of a list of objects, one per row, the response holds an array per
+field, and related objects that repeat from row to row (the project of each
+repository) are sent once in a lookup table and referred to by position:
+
+    {
+        "rows": 2,
+        "columns": {"id": [3, 5], "name": ["api", "web"], "project": [0, 0], ...},
+        "projects": {"id": [1], "name": ["BM"], ...}
+    }
+
+The columns are built from .values() querysets, without ModelSerializer, and
+rendered with orjson when it is installed.
+
+The exports stream NDJSON, one JSON object per line, or CSV with a header row,
+?format=ndjson or ?format=csv.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    """Returns: data as JSON bytes, with orjson if available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def columns(rows, fields):
+    """Returns: {field: [value of each row]} for a sequence of dicts"""
+    return {field: [row[field] for row in rows] for field in fields}
+
+
+def columnar(rows, fields, related=None):
+    """Turn .values() rows into the columnar format.
+
+    Args:
+        rows: the dicts of a .values() queryset
+        fields: the fields to send, in order
+        related: optional {name: (key, fields)}; the distinct values of the
+            key field of the rows become a lookup table under name, with the
+            given fields taken from the rows prefixed by key__, and the
+            column of the key holds positions in that table
+    Returns: dict with rows, columns and one entry per related lookup table
+    """
+    rows = list(rows)
+    result = {'rows': len(rows), 'columns': columns(rows, fields)}
+    for name, (key, related_fields) in (related or {}).items():
+        position = {}
+        table = []
+        for row in rows:
+            if row[key] not in position:
+                position[row[key]] = len(table)
+                table.append({field: row[f'{key}__{field}'] for field in related_fields})
+        result['columns'][key] = [position[row[key]] for row in rows]
+        result[name] = columns(table, related_fields)
+    return result
+
+
+class ColumnarRenderer(renderers.BaseRenderer):
+    """Renders the columnar format as JSON, with orjson if available"""
+    media_type = 'application/json'
+    format = 'columnar'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class StreamingRenderer(renderers.BaseRenderer):
+    """Base of the export formats. stream() and astream() render the rows of
+    an export as they are read, render() only serves the errors."""
+    charset = 'utf-8'
+
+    def stream(self, rows, fields, chunk_size):
+        """Args:
+            rows: iterator of tuples in the order of fields
+            fields: the names of the columns
+            chunk_size: number of rows rendered into each chunk
+        Returns: generator of bytes"""
+        if header := self.header(fields):
+            yield header
+        rows = iter(rows)
+        while chunk := list(islice(rows, chunk_size)):
+            yield self.chunk(chunk, fields)
+
+    async def astream(self, rows, fields, chunk_size):
+        """stream() for an async iterator of rows, such as
+        QuerySet.aiterator(), to be served by ASGI"""
+        if header := self.header(fields):
+            yield header
+        chunk = []
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield self.chunk(chunk, fields)
+                chunk = []
+        if chunk:
+            yield self.chunk(chunk, fields)
+
+    def header(self, fields):
+        return b''
+
+    def chunk(self, rows, fields):
+        raise NotImplementedError
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return dumps(data) + b'\n'
+
+    def chunk(self, rows, fields):
+        return b''.join(dumps(dict(zip(fields, row))) + b'\n' for row in rows)
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = data.items()
+        return self.chunk(data, None)
+
+    def header(self, fields):
+        return self.chunk([fields], fields)
+
+    def chunk(self, rows, fields):
+        out = io.StringIO()
+        csv.writer(out).writerows(rows)
+        return out.getvalue().encode('utf-8')
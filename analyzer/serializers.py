@@ -1,11 +1,18 @@
 from rest_framework import serializers
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Q
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 
 from .models import Project, Author, Alias, Repository, Commit, Contrib
 
 
+def recent_commits(commits):
+    """Returns: the commits of the last 7 days, newest first"""
+    seven_days_ago = timezone.now() - timedelta(days=7)
+    return commits.filter(timestamp__gte=seven_days_ago).order_by('-timestamp')
+
+
 class ProjectSerializer(serializers.ModelSerializer):
     """General purpose Serializer for Project model."""
     class Meta:
@@ -69,9 +76,17 @@ class AuthorDetailSerializer(serializers.ModelSerializer):
     the last 7 days."""
     commits = serializers.SerializerMethodField()
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Fetch the commits of all authors, with their repositories and
+        projects, in one query"""
+        commits = recent_commits(Commit.objects.select_related('repository__project'))[0:100]
+        return queryset.prefetch_related(Prefetch('commit_set', queryset=commits, to_attr='recent_commits'))
+
     def get_commits(self, obj):
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        commits = obj.commit_set.filter(timestamp__gte=seven_days_ago).order_by('-timestamp')[0:100]
+        commits = getattr(obj, 'recent_commits', None)
+        if commits is None:
+            commits = recent_commits(obj.commit_set.select_related('repository__project'))[0:100]
         return CommitRepositorySerializer(commits, many=True).data
 
     class Meta:
@@ -79,6 +94,23 @@ class AuthorDetailSerializer(serializers.ModelSerializer):
         fields = ['name', 'slug', 'commits']
 
 
+class ProjectDetailListSerializer(serializers.ListSerializer):
+    """Finds the recent commits of all the projects with one query"""
+
+    def to_representation(self, data):
+        projects = list(data.all() if hasattr(data, 'all') else data)
+        commits = recent_commits(Commit.objects.filter(repository__project__in=projects))\
+            .annotate(project_id=F('repository__project'),
+                      rank=Window(RowNumber(), partition_by=F('repository__project'), order_by=F('timestamp').desc()))\
+            .filter(rank__lte=100)
+        by_project = {project.id: [] for project in projects}
+        for commit in commits:
+            by_project[commit.project_id].append(commit)
+        for project in projects:
+            project.recent_commits = by_project[project.id]
+        return super().to_representation(projects)
+
+
 class ProjectDetailSerializer(serializers.ModelSerializer):
     """Serializer for Project model with commits field.
     The commits field is a list of the last 100 commits made in the last 7 days 
@@ -86,15 +118,15 @@ class ProjectDetailSerializer(serializers.ModelSerializer):
     commits = serializers.SerializerMethodField()
 
     def get_commits(self, obj):
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        commits = Commit.objects.filter( Q(timestamp__gte=seven_days_ago) & Q(repository__project=obj)
-                                         ).order_by('-timestamp')[0:100]
-        
+        commits = getattr(obj, 'recent_commits', None)
+        if commits is None:
+            commits = recent_commits(Commit.objects.filter(repository__project=obj))[0:100]
         return CommitSerializer(commits, many=True).data
     
     class Meta:
         model = Project
         fields = ['name', 'lines', 'contributors', 'last_fetch', 'commits']
+        list_serializer_class = ProjectDetailListSerializer
 
 
 class RepositoryDetailSerializer(serializers.ModelSerializer):
@@ -104,10 +136,18 @@ class RepositoryDetailSerializer(serializers.ModelSerializer):
     commits = serializers.SerializerMethodField()
     project = ProjectSerializer(read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Fetch the projects, and the commits with their authors, of all
+        repositories in two queries"""
+        commits = recent_commits(Commit.objects.select_related('author'))[0:100]
+        return queryset.select_related('project')\
+                       .prefetch_related(Prefetch('commit_set', queryset=commits, to_attr='recent_commits'))
+
     def get_commits(self, obj):
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        commits = Commit.objects.filter( Q(timestamp__gte=seven_days_ago) & Q(repository=obj)
-                                         ).order_by('-timestamp')[0:100]
+        commits = getattr(obj, 'recent_commits', None)
+        if commits is None:
+            commits = recent_commits(obj.commit_set.select_related('author'))[0:100]
         return CommitAuthorSerializer(commits, many=True).data
         
     class Meta:
@@ -1,3 +1,1099 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+from git import GitCommandError, Repo
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.urls import reverse
+
+from analyzer.models import AnalysisJob, Author, BlameFile, Commit, Contrib, DailyCommits, Generation, Project, Repository
+from analyzer.models import Alias, AuthorCache, author_cache
+from analyzer import importer
+from analyzer.importer import list_blobs
+from analyzer.management.commands.analyze import Command as AnalyzeCommand
+from analyzer.management.commands.analyze_worker import Heartbeat
+from analyzer.views import weekly_activity
+
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'Test Author', 'GIT_AUTHOR_EMAIL': 'author@example.com',
+    'GIT_COMMITTER_NAME': 'Test Author', 'GIT_COMMITTER_EMAIL': 'author@example.com',
+}
+
+
+def git(cwd, *args, env=None):
+    subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True, env={**os.environ, **GIT_ENV, **(env or {})})
+
+
+class GitRepoTestCase(TestCase):
+    """Tests on a small repository, created in a temporary directory, that
+    are analyzed at self.path"""
+
+    def setUp(self):
+        # Authors cached by an earlier test were rolled back with it
+        author_cache.invalidate()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'project', 'repo')
+        os.makedirs(self.path)
+        git(self.path, 'init', '-b', 'main')
+        self.repo = Repo(self.path)
+
+    def write(self, path, *lines):
+        os.makedirs(os.path.dirname(os.path.join(self.path, path)), exist_ok=True)
+        with open(os.path.join(self.path, path), 'w') as f:
+            f.writelines(f'{line}\n' for line in lines)
+
+    def commit(self, author, message='change', date=None):
+        """Commit everything in the work tree as author.
+        Returns: SHA of the commit"""
+        git(self.path, 'add', '-A')
+        args = ['commit', '-q', '-m', message, f'--author={author} <{author.lower()}@example.com>']
+        if date:
+            args.append(f'--date={date}')
+        git(self.path, *args, env={'GIT_COMMITTER_DATE': date} if date else None)
+        return self.repo.head.commit.hexsha
+
+    def analyze(self, *args):
+        call_command('analyze', self.path, '--no-fetch', '--skip-analysis-hours', '0', *args)
+
+    def counts(self, path):
+        return BlameFile.objects.get(repository__name='repo', path=path).counts
+
+
+class LineCountTest(GitRepoTestCase):
+    """Line counts follow changes to the files that are counted"""
+
+    def test_replay_counts_files_no_longer_excluded(self):
+        self.write('f1.txt', 'a', 'b', 'c')
+        self.write('f2.txt', 'a', 'b')
+        self.commit('Ann')
+        self.analyze('--lines-engine', 'replay', '--exclude', 'f1.txt')
+        self.assertFalse(BlameFile.objects.filter(path='f1.txt').exists())
+
+        # f1.txt changed while it was excluded, f3.txt is new
+        self.write('f1.txt', 'a', 'b', 'c', 'd')
+        self.write('f2.txt', 'a', 'b', 'c')
+        self.write('f3.txt', 'a')
+        self.commit('Bob')
+        with mock.patch('analyzer.management.commands.analyze.replay_ownership',
+                        wraps=importer.replay_ownership) as replay:
+            self.analyze('--lines-engine', 'replay')
+        # f1.txt is blamed, the history is not replayed from the start for it
+        self.assertEqual(replay.call_count, 1)
+        self.assertIsNotNone(replay.call_args.args[1])
+
+        self.assertEqual(self.counts('f1.txt'), {'Ann': 3, 'Bob': 1})
+        self.assertEqual(self.counts('f2.txt'), {'Ann': 2, 'Bob': 1})
+        self.assertEqual(self.counts('f3.txt'), {'Bob': 1})
+        self.assertEqual(Repository.objects.get(name='repo').lines, 8)
+
+    def test_lines_counted_after_skip_blame(self):
+        self.write('f1.txt', 'a', 'b', 'c')
+        self.commit('Ann')
+        self.analyze()
+        self.write('f1.txt', 'a', 'b', 'c', 'd')
+        head = self.commit('Bob')
+        self.analyze('--skip-blame')
+
+        # No ref moved since, but the lines were counted at the old head
+        self.analyze()
+        repository = Repository.objects.get(name='repo')
+        self.assertEqual((repository.lines, repository.blame_commit), (4, head))
+        self.assertEqual(self.counts('f1.txt'), {'Ann': 3, 'Bob': 1})
+
+
+class ReplayTest(GitRepoTestCase):
+    """replay_ownership follows renames, deletions, quoted paths and the first
+    parent of merges"""
+
+    QUOTED = 'tab\tand é.txt'
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.txt', '1', '2', '3')
+        self.write('b.txt', '1', '2', '3', '4')
+        self.write('d.txt', '1')
+        self.write(self.QUOTED, 'x')
+        self.commit('Ann')
+
+        self.write('a.txt', '1', 'B', '3', 'new')
+        git(self.path, 'mv', 'b.txt', 'c.txt')
+        self.write('c.txt', '1', '2', '3', 'B')
+        self.write(self.QUOTED, 'y')
+        self.middle = self.commit('Bob')
+
+        git(self.path, 'checkout', '-q', '-b', 'side')
+        self.write('c.txt', 'top', '1', '2', '3', 'B')
+        self.commit('Cat')
+        git(self.path, 'checkout', '-q', 'main')
+        git(self.path, 'merge', '-q', '--no-ff', '-m', 'merge', 'side')
+
+        os.remove(os.path.join(self.path, 'd.txt'))
+        self.commit('Dan')
+
+    def test_whole_history(self):
+        self.assertEqual(importer.replay_ownership(self.repo, None, 'main'), {
+            'a.txt': ['Ann', 'Bob', 'Ann', 'Bob'],
+            'b.txt': None,
+            # The merge brings the lines of the side branch in as its own
+            'c.txt': ['Test Author', 'Ann', 'Ann', 'Ann', 'Bob'],
+            'd.txt': None,
+            self.QUOTED: ['Bob'],
+        })
+
+    def test_on_top_of_known_owners(self):
+        known = importer.replay_ownership(self.repo, None, self.middle)
+        touched = importer.replay_ownership(self.repo, self.middle, 'main', known.get)
+        self.assertEqual(touched, {'c.txt': ['Test Author', 'Ann', 'Ann', 'Ann', 'Bob'], 'd.txt': None})
+
+    def test_apply_hunks(self):
+        lines = ['a', 'b', 'c']
+        self.assertEqual(importer.apply_hunks(lines, [(0, 0, 1)], 'X'), ['X', 'a', 'b', 'c'])
+        self.assertEqual(importer.apply_hunks(lines, [(1, 0, 1), (3, 1, 0)], 'X'), ['a', 'X', 'b'])
+        self.assertEqual(importer.apply_hunks(lines, [(2, 1, 2)], 'X'), ['a', 'X', 'X', 'c'])
+
+    def test_quoted_paths(self):
+        self.assertEqual(importer.diff_git_path(b'"a/tab\\tand \\303\\251.txt" "b/tab\\tand \\303\\251.txt"'),
+                         self.QUOTED)
+        self.assertEqual(importer.diff_git_path(b'a/x y.txt b/x y.txt'), 'x y.txt')
+
+
+class FilterChangeTest(GitRepoTestCase):
+    """Changing --exclude or --max-blob-size counts lines again though no ref moved"""
+
+    def test_new_filters_are_not_skipped(self):
+        self.write('f1.txt', 'a', 'b')
+        self.write('f2.txt', 'a')
+        self.commit('Ann')
+        self.analyze()
+        self.assertEqual(Repository.objects.get(name='repo').lines, 3)
+
+        self.analyze('--exclude', 'f2.txt')
+        self.assertEqual(Repository.objects.get(name='repo').lines, 2)
+        self.assertFalse(BlameFile.objects.filter(path='f2.txt').exists())
+
+        generation = Generation.current()
+        self.analyze('--exclude', 'f2.txt')
+        self.assertEqual(Generation.current(), generation)
+
+
+class FileFilterTest(GitRepoTestCase):
+    """Only text files are counted and known blobs are not read again"""
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.txt', 'text')
+        with open(os.path.join(self.path, 'big.bin'), 'wb') as f:
+            f.write(b'\0' + os.urandom(1 << 20))
+        self.write('z.txt', 'more text')
+        self.commit('Ann')
+
+    def test_binary_blobs_are_skipped(self):
+        blobs, skipped = list_blobs(self.repo, 'HEAD', max_size=0)
+        self.assertEqual(sorted(blobs), ['a.txt', 'z.txt'])
+        self.assertEqual(skipped['binary'], 1)
+
+    def test_known_text_blobs_are_not_read(self):
+        known = {self.repo.head.commit.tree['a.txt'].hexsha}
+        with mock.patch('analyzer.importer.is_binary', wraps=importer.is_binary) as sniff:
+            blobs, _ = list_blobs(self.repo, 'HEAD', max_size=0, text_blobs=known)
+        self.assertEqual(sorted(blobs), ['a.txt', 'z.txt'])
+        self.assertEqual(sniff.call_count, 2)
+
+    def test_attributes_of_the_commit(self):
+        self.write('.gitattributes', 'gen.js linguist-generated', 'docs/* -diff')
+        self.write('gen.js', 'x')
+        self.write('docs/x.txt', 'x')
+        self.commit('Ann')
+        # Only the committed rules count
+        self.write('.gitattributes', 'a.txt binary')
+
+        blobs, skipped = list_blobs(self.repo, 'HEAD', max_size=0)
+        self.assertEqual(sorted(blobs), ['.gitattributes', 'a.txt', 'z.txt'])
+        self.assertEqual(skipped, {'path': 0, 'size': 0, 'attributes': 2, 'binary': 1})
+
+        blobs, skipped = list_blobs(self.repo, 'HEAD', max_size=0, attributes=['linguist-documentation'], sniff=False)
+        self.assertEqual(len(blobs), 6)
+        self.assertEqual(skipped, {'path': 0, 'size': 0, 'attributes': 0, 'binary': 0})
+
+    def test_skip_counts_are_stored(self):
+        self.analyze('--exclude', 'z.txt')
+        repository = Repository.objects.get(name='repo')
+        self.assertEqual((repository.files, repository.skipped_files),
+                         (1, {'path': 1, 'size': 1, 'attributes': 0, 'binary': 0}))
+
+        self.analyze('--max-blob-size', '0', '--no-binary-check', '--skip-attributes', '')
+        repository = Repository.objects.get(name='repo')
+        self.assertEqual((repository.files, repository.skipped_files),
+                         (3, {'path': 0, 'size': 0, 'attributes': 0, 'binary': 0}))
+
+
+class LogStreamTest(GitRepoTestCase):
+    """iter_log parses the records of git log -z across chunk boundaries"""
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.txt', 'a')
+        self.first = self.commit('Ann', 'first')
+        self.write('a.txt', 'b')
+        self.second = self.commit('Zoë', 'second\n\nwith a body\tand a tab')
+
+    def test_records(self):
+        for chunk_size in (3, 65536):
+            entries = list(importer.iter_log(self.repo, 'main', chunk_size=chunk_size))
+            self.assertEqual([entry.hexsha for entry in entries], [self.second, self.first])
+            self.assertEqual((entries[0].author_name, entries[0].author_email), ('Zoë', 'zoë@example.com'))
+            self.assertEqual(entries[0].message, 'second\n\nwith a body\tand a tab')
+            self.assertEqual(entries[1].committed_datetime, self.repo.commit(self.first).committed_datetime)
+
+    def test_revisions_on_stdin(self):
+        entries = importer.iter_log(self.repo, '--no-walk', revisions=[self.first])
+        self.assertEqual([entry.message for entry in entries], ['first'])
+
+    def test_bad_revision(self):
+        with self.assertRaises(GitCommandError):
+            list(importer.iter_log(self.repo, 'no-such-branch'))
+
+
+class BlameFileTest(GitRepoTestCase):
+    """blame_file adds up the line groups of git blame --incremental"""
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.txt', '1', '2', '3', '4', '5')
+        self.write('tab\tand é.txt', '1')
+        self.commit('Ann')
+        # Ann's commit ends up in two groups, its author is only given once
+        self.write('a.txt', '1', 'B', 'B', '4', '5', 'B')
+        self.commit('Zoë')
+
+    def test_counts(self):
+        self.assertEqual(importer.blame_file(self.repo, 'HEAD', 'a.txt'), {'Ann': 3, 'Zoë': 3})
+        self.assertEqual(importer.blame_file(self.repo, 'HEAD', 'tab\tand é.txt'), {'Ann': 1})
+        with self.assertRaises(GitCommandError):
+            importer.blame_file(self.repo, 'HEAD', 'missing.txt')
+
+    def test_owners(self):
+        self.assertEqual(importer.blame_owners(self.repo, 'HEAD', 'a.txt'), ['Ann', 'Zoë', 'Zoë', 'Ann', 'Ann', 'Zoë'])
+
+    def test_workers(self):
+        paths = ['a.txt', 'missing.txt', 'tab\tand é.txt']
+        expected = {'a.txt': {'Ann': 3, 'Zoë': 3}, 'missing.txt': {}, 'tab\tand é.txt': {'Ann': 1}}
+        for workers in (1, 2):
+            self.assertEqual(dict(importer.blame_files(self.repo, 'HEAD', paths, workers)), expected)
+
+
+class BlameChangesTest(GitRepoTestCase):
+    """The blame engine only blames the files that changed since the last run"""
+
+    QUOTED = 'tab\tand é.txt'
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.txt', 'a', 'b')
+        self.write('b.txt', 'a', 'b', 'c')
+        self.write('same.txt', 'a')
+        self.write(self.QUOTED, 'a')
+        self.old = self.commit('Ann')
+
+    def change(self):
+        """Modify a.txt, rename b.txt and delete the file with the quoted name"""
+        self.write('a.txt', 'a', 'new')
+        git(self.path, 'mv', 'b.txt', 'c.txt')
+        os.remove(os.path.join(self.path, self.QUOTED))
+        return self.commit('Bob')
+
+    def test_changed_paths(self):
+        new = self.change()
+        self.assertEqual(importer.changed_paths(self.repo, self.old, new),
+                         ({'a.txt', 'c.txt'}, {'b.txt', self.QUOTED}))
+        self.assertIsNone(importer.changed_paths(self.repo, '0' * 40, new))
+
+    def test_only_changed_files_are_blamed(self):
+        self.analyze()
+        self.change()
+        with mock.patch('analyzer.importer.blame_file', wraps=importer.blame_file) as blame:
+            self.analyze()
+
+        self.assertEqual(sorted(c.args[2] for c in blame.call_args_list), ['a.txt', 'c.txt'])
+        self.assertEqual(set(BlameFile.objects.values_list('path', flat=True)), {'a.txt', 'c.txt', 'same.txt'})
+        self.assertEqual(self.counts('a.txt'), {'Ann': 1, 'Bob': 1})
+        self.assertEqual(self.counts('c.txt'), {'Ann': 3})
+        self.assertEqual(Repository.objects.get(name='repo').lines, 6)
+
+
+class TipRangeTest(GitRepoTestCase):
+    """New commits are found from the ref tips, whatever their dates"""
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.txt', 'a')
+        self.first = self.commit('Ann')
+
+    def test_back_dated_commit_on_side_branch(self):
+        self.analyze()
+        git(self.path, 'checkout', '-q', '-b', 'side')
+        self.write('b.txt', 'b')
+        old = self.commit('Bob', date='2001-01-01T00:00:00+00:00')
+        git(self.path, 'checkout', '-q', 'main')
+        self.write('a.txt', 'a', 'c')
+        new = self.commit('Cat')
+
+        with mock.patch.object(AnalyzeCommand, 'save_commits', autospec=True,
+                               side_effect=AnalyzeCommand.save_commits) as save:
+            self.analyze()
+
+        # Only the commits since the previous tips are read
+        self.assertEqual(sorted(entry.hexsha for c in save.call_args_list for entry in c.args[1]), sorted([old, new]))
+        self.assertEqual(Commit.objects.count(), 3)
+        self.assertEqual(Repository.objects.get(name='repo').ref_tips, sorted([old, new]))
+
+    def test_tips(self):
+        git(self.path, 'tag', '-a', '-m', 'release', 'v1')
+        git(self.path, 'branch', 'side')
+        tag = self.repo.tags['v1'].tag.hexsha
+        self.assertEqual(importer.ref_tips(self.repo), sorted([self.first, tag]))
+        self.assertEqual(importer.existing_objects(self.repo, [self.first, '0' * 40]), [self.first])
+
+
+class ParallelImportTest(TransactionTestCase):
+    """analyze --jobs saves the same data as a serial run"""
+
+    def setUp(self):
+        author_cache.invalidate()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        for number, name in enumerate(['alpha', 'beta', 'gamma']):
+            path = os.path.join(self.tmp, 'project', name)
+            os.makedirs(path)
+            git(path, 'init', '-b', 'main')
+            for author in ['Ann', 'Bob', 'Cat'][:number + 1]:
+                with open(os.path.join(path, f'{author}.txt'), 'w') as f:
+                    f.write(f'{name}\n' * (number + 2))
+                git(path, 'add', '-A')
+                git(path, 'commit', '-q', '-m', author, f'--author={author} <{author.lower()}@example.com>')
+
+    def totals(self, *args):
+        call_command('analyze', self.tmp, '--all', '--no-fetch', *args)
+        totals = (
+            Commit.objects.count(),
+            sorted(Contrib.objects.values_list('author__name', 'repository__name', 'count')),
+            sorted(Repository.objects.values_list('name', 'lines', 'contributors')),
+            sorted(Project.objects.values_list('name', 'lines', 'contributors')),
+        )
+        call_command('flush', '--no-input')
+        author_cache.invalidate()
+        return totals
+
+    def test_same_totals(self):
+        parallel = self.totals('--jobs', '2')
+        self.assertEqual(parallel[0], 6)
+        self.assertEqual(parallel, self.totals())
+
+
+class FetchStageTest(TestCase):
+    """analyze --fetch-jobs against bare repositories served over file://"""
+
+    def setUp(self):
+        # Authors cached by an earlier test were rolled back with it
+        author_cache.invalidate()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.base = os.path.join(self.tmp, 'base')
+        self.remotes = {}
+        for name in ('alpha', 'beta'):
+            remote = os.path.join(self.tmp, 'remotes', f'{name}.git')
+            git(self.tmp, 'init', '--bare', '-b', 'main', remote)
+            work = os.path.join(self.tmp, 'work', name)
+            git(self.tmp, 'clone', f'file://{remote}', work)
+            self.commit(work, f'first in {name}')
+            git(work, 'push', 'origin', 'main')
+            git(self.tmp, 'clone', f'file://{remote}', os.path.join(self.base, 'project', name))
+            self.remotes[name] = work
+
+    def commit(self, work, message):
+        with open(os.path.join(work, 'file.txt'), 'a') as f:
+            f.write(f'{message}\n')
+        git(work, 'add', 'file.txt')
+        git(work, 'commit', '-m', message)
+
+    def analyze(self, *args):
+        call_command('analyze', self.base, '--all', '--fetch-jobs', '2', '--skip-fetch-hours', '0',
+                     '--skip-analysis-hours', '0', '--skip-blame', *args)
+
+    def test_fetched_commits_are_analyzed(self):
+        self.commit(self.remotes['alpha'], 'second')
+        git(self.remotes['alpha'], 'push', 'origin', 'main')
+
+        self.analyze()
+
+        self.assertEqual(Commit.objects.filter(repository__name='alpha').count(), 2)
+        self.assertEqual(Commit.objects.filter(repository__name='beta').count(), 1)
+        self.assertTrue(Repository.objects.get(name='alpha').success)
+
+    def test_idle_sweep_keeps_generation(self):
+        self.analyze()
+        generation = Generation.current()
+        self.analyze()
+        self.assertEqual(Generation.current(), generation)
+
+        self.commit(self.remotes['alpha'], 'second')
+        git(self.remotes['alpha'], 'push', 'origin', 'main')
+        self.analyze()
+        self.assertGreater(Generation.current(), generation)
+
+    def test_failed_fetch_marks_repository(self):
+        shutil.rmtree(os.path.join(self.tmp, 'remotes', 'beta.git'))
+
+        self.analyze('--fetch-retries', '0')
+
+        beta = Repository.objects.get(name='beta')
+        self.assertFalse(beta.success)
+        self.assertIn('fetch', beta.message)
+        self.assertTrue(Repository.objects.get(name='alpha').success)
+
+
+class AuthorCacheTest(TestCase):
+    """The cache of an analyze process follows aliases saved elsewhere"""
+
+    def test_alias_saved_between_resolves(self):
+        # Stands for the cache of another process, the signal only clears author_cache
+        cache = AuthorCache()
+        old = cache.resolve(['Old Name'])['Old Name']
+        new = Author.objects.create(name='New Name', slug='new-name')
+        Alias.objects.create(author=new, slug=old.slug)
+        self.assertFalse(Author.objects.filter(pk=old.pk).exists())
+
+        author = cache.resolve(['Old Name'])['Old Name']
+        self.assertEqual(author.pk, new.pk)
+        project = Project.objects.create(name='project')
+        repository = Repository.objects.create(name='alpha', project=project, url='https://example.com/alpha.git')
+        Commit.objects.create(hash='0' * 40, author=author, repository=repository, timestamp=timezone.now(), message='')
+
+    def test_other_changes_keep_cache(self):
+        cache = AuthorCache()
+        cache.resolve(['Ann'])
+        Generation.bump()
+        # Only the alias counter is read, authors are not loaded again
+        with self.assertNumQueries(1):
+            cache.resolve(['Ann'])
+
+
+class WebhookTest(TestCase):
+    """Push payloads are matched to repositories and coalesced into one job"""
+
+    def setUp(self):
+        project = Project.objects.create(name='project')
+        self.repository = Repository.objects.create(name='alpha', project=project,
+                                                    url='git@github.com:Example/alpha.git')
+
+    def post(self, headers, payload):
+        return self.client.post(reverse('gitdb-webhook'), payload, content_type='application/json', headers=headers)
+
+    def test_github_pushes_are_coalesced(self):
+        payload = {'repository': {'name': 'alpha', 'clone_url': 'https://github.com/example/alpha.git'}}
+        for _ in range(3):
+            self.assertEqual(self.post({'X-GitHub-Event': 'push'}, payload).status_code, 202)
+
+        job = AnalysisJob.objects.get()
+        self.assertEqual((job.repository, job.source, job.pushes), (self.repository, 'github', 3))
+
+    def test_gitlab_push_by_ssh_url(self):
+        payload = {'project': {'path': 'other-name', 'git_ssh_url': 'git@github.com:example/alpha.git'}}
+        self.assertEqual(self.post({'X-Gitlab-Event': 'Push Hook'}, payload).status_code, 202)
+        self.assertEqual(AnalysisJob.objects.get().repository, self.repository)
+
+    def test_other_events_and_repositories(self):
+        payload = {'repository': {'slug': 'beta', 'links': {'clone': [{'href': 'https://bb.example.com/scm/p/beta.git'}]}}}
+        self.assertEqual(self.post({'X-Event-Key': 'repo:refs_changed'}, payload).status_code, 404)
+        self.assertEqual(self.post({'X-Event-Key': 'pr:opened'}, payload).json()['status'], 'ignored')
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_same_name_elsewhere(self):
+        fork = {'repository': {'name': 'alpha', 'clone_url': 'https://github.com/fork/alpha.git'}}
+        self.assertEqual(self.post({'X-GitHub-Event': 'push'}, fork).status_code, 404)
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_payload_not_an_object(self):
+        for payload in ([], 'alpha', b'{'):
+            self.assertEqual(self.post({'X-GitHub-Event': 'push'}, payload).status_code, 400)
+
+    @override_settings(GITDB_WEBHOOK_SECRET='s3cret')
+    def test_secret_is_verified(self):
+        payload = {'repository': {'name': 'alpha', 'clone_url': 'https://github.com/example/alpha.git'}}
+        body = json.dumps(payload).encode()
+        signature = 'sha256=' + hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+
+        github = {'X-GitHub-Event': 'push'}
+        self.assertEqual(self.post(github, payload).status_code, 403)
+        self.assertEqual(self.post({**github, 'X-Hub-Signature-256': 'sha256=0'}, payload).status_code, 403)
+        self.assertEqual(self.post({**github, 'X-Hub-Signature-256': signature}, body).status_code, 202)
+
+        gitlab = {'X-Gitlab-Event': 'Push Hook'}
+        payload = {'project': {'path': 'alpha', 'git_ssh_url': 'git@github.com:example/alpha.git'}}
+        self.assertEqual(self.post({**gitlab, 'X-Gitlab-Token': 'wrong'}, payload).status_code, 403)
+        self.assertEqual(self.post({**gitlab, 'X-Gitlab-Token': 's3cret'}, payload).status_code, 202)
+
+        bitbucket = {'X-Event-Key': 'repo:refs_changed', 'X-Hub-Signature': signature}
+        payload = {'repository': {'slug': 'alpha', 'links': {'clone': [{'href': 'ssh://git@github.com/example/alpha.git'}]}}}
+        self.assertEqual(self.post(bitbucket, payload).status_code, 403)
+        body = json.dumps(payload).encode()
+        bitbucket['X-Hub-Signature'] = 'sha256=' + hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+        self.assertEqual(self.post(bitbucket, body).status_code, 202)
+        self.assertEqual(AnalysisJob.objects.get().pushes, 3)
+
+
+class JobQueueTest(TestCase):
+    """Workers claim jobs by priority, renew their leases and reclaim expired ones"""
+
+    def setUp(self):
+        project = Project.objects.create(name='project')
+        self.alpha = Repository.objects.create(name='alpha', project=project, url='https://example.com/alpha.git')
+        self.beta = Repository.objects.create(name='beta', project=project, url='https://example.com/beta.git')
+        self.lease = timedelta(minutes=5)
+
+    def test_webhook_jobs_go_first(self):
+        AnalysisJob.enqueue(self.alpha, AnalysisJob.REFRESH, 0, AnalysisJob.REFRESH_PRIORITY, push=False)
+        AnalysisJob.enqueue(self.beta, 'github', 0)
+
+        first = AnalysisJob.claim('one', self.lease)
+        second = AnalysisJob.claim('two', self.lease)
+        self.assertEqual((first.repository, first.worker), (self.beta, 'one'))
+        self.assertEqual((second.repository, second.worker), (self.alpha, 'two'))
+        self.assertIsNone(AnalysisJob.claim('three', self.lease))
+
+    def test_push_raises_priority_of_pending_refresh(self):
+        AnalysisJob.enqueue(self.alpha, AnalysisJob.REFRESH, 0, AnalysisJob.REFRESH_PRIORITY, push=False)
+        job = AnalysisJob.enqueue(self.alpha, 'gitlab', 0)
+        self.assertEqual((job.priority, job.pushes), (AnalysisJob.WEBHOOK_PRIORITY, 1))
+
+    def test_expired_lease_is_reclaimed(self):
+        AnalysisJob.enqueue(self.alpha, 'github', 0)
+        job = AnalysisJob.claim('one', self.lease)
+        # A new push to a repository that is being analyzed waits for it
+        AnalysisJob.enqueue(self.alpha, 'github', 0)
+        self.assertIsNone(AnalysisJob.claim('two', self.lease))
+
+        AnalysisJob.objects.filter(pk=job.pk).update(lease_expires=job.lease_expires - timedelta(hours=1))
+        reclaimed = AnalysisJob.claim('two', self.lease)
+        self.assertEqual((reclaimed.pk, reclaimed.worker, reclaimed.attempts), (job.pk, 'two', 2))
+
+        # The first worker can neither renew nor finish the job any more
+        self.assertFalse(job.renew('one', self.lease))
+        job.finish('one', AnalysisJob.DONE)
+        self.assertEqual(AnalysisJob.objects.get(pk=job.pk).status, AnalysisJob.RUNNING)
+
+    def test_jobs_fail_after_max_attempts(self):
+        AnalysisJob.enqueue(self.alpha, 'github', 0)
+        job = AnalysisJob.claim('one', self.lease, max_attempts=1)
+        AnalysisJob.objects.filter(pk=job.pk).update(lease_expires=job.lease_expires - timedelta(hours=1))
+        self.assertIsNone(AnalysisJob.claim('two', self.lease, max_attempts=1))
+        self.assertEqual(AnalysisJob.objects.get(pk=job.pk).status, AnalysisJob.FAILED)
+
+
+class WorkerTest(GitRepoTestCase):
+    """analyze_worker runs the due jobs and records their outcome"""
+
+    def setUp(self):
+        super().setUp()
+        self.write('a.txt', 'a', 'b')
+        self.commit('Ann')
+        self.analyze()
+        self.repository = Repository.objects.get(name='repo')
+        self.write('a.txt', 'a', 'b', 'c')
+        self.commit('Bob')
+
+    def work(self):
+        call_command('analyze_worker', '--once', '--no-fetch', '--worker-id', 'w1')
+
+    def test_once(self):
+        job = AnalysisJob.enqueue(self.repository, 'github', 0)
+        other = Repository.objects.create(name='nopath', project=self.repository.project,
+                                          url='https://example.com/nopath.git')
+        refresh = AnalysisJob.enqueue(other, AnalysisJob.REFRESH, 0, AnalysisJob.REFRESH_PRIORITY, push=False)
+        self.work()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (AnalysisJob.DONE, 'w1', 1))
+        self.assertTrue(job.message.startswith('3 lines, 2 contributors'), job.message)
+        self.assertEqual(Commit.objects.count(), 2)
+        refresh.refresh_from_db()
+        self.assertEqual(refresh.status, AnalysisJob.FAILED)
+        self.assertIn('path unknown', refresh.message)
+
+    def test_expired_lease_is_reclaimed(self):
+        AnalysisJob.enqueue(self.repository, 'github', 0)
+        job = AnalysisJob.claim('dead', timedelta(minutes=5))
+        self.work()
+        self.assertEqual(AnalysisJob.objects.get(pk=job.pk).status, AnalysisJob.RUNNING)
+
+        AnalysisJob.objects.filter(pk=job.pk).update(lease_expires=timezone.now() - timedelta(seconds=1))
+        self.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), (AnalysisJob.DONE, 'w1', 2))
+
+    def test_heartbeat_stops_when_lease_is_lost(self):
+        job = mock.Mock(id=1)
+        job.renew.side_effect = [True, False]
+        lease = timedelta(milliseconds=30)
+        heartbeat = Heartbeat(job, 'w1', lease)
+        heartbeat.start()
+        heartbeat.join(5)
+        self.assertFalse(heartbeat.is_alive())
+        self.assertEqual(job.renew.call_args_list, [mock.call('w1', lease)] * 2)
+
+
+class QueryPlanTest(TestCase):
+    """The dashboard queries must not scan the large tables from end to end"""
+    LARGE_TABLES = {'analyzer_commit', 'analyzer_dailycommits'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(name='project')
+        cls.repository = Repository.objects.create(name='alpha', project=cls.project, url='https://example.com/alpha.git')
+        cls.author = Author.objects.create(name='Author', slug='author')
+        now = timezone.now()
+        Commit.objects.bulk_create(
+            Commit(hash=f'{i:040x}', author=cls.author, repository=cls.repository,
+                   timestamp=now - timedelta(hours=i * 7), message='')
+            for i in range(200))
+        DailyCommits.refresh()
+
+    def setUp(self):
+        # A cached response would not run the queries
+        caches['api'].clear()
+
+    def full_scans(self, sql):
+        """Returns: the large tables the query plan of sql reads without an index"""
+        tables = {alias: table for table, alias in re.findall(r'"(analyzer_\w+)" ([A-Z]\d+)', sql)}
+        tables.update((table, table) for table in self.LARGE_TABLES)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        # A SCAN reads the whole table, or the whole of an index with USING
+        # INDEX; only a SEARCH narrows the rows down with the index
+        scans = [re.match(r'SCAN (\w+)\b', step) for step in plan]
+        return {tables.get(scan[1]) for scan in scans if scan} & self.LARGE_TABLES
+
+    def assertIndexed(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for query in queries:
+            if query['sql'].startswith('SELECT'):
+                self.assertFalse(self.full_scans(query['sql']), query['sql'])
+
+    def test_index_scans_are_caught(self):
+        # Reads every entry of an index, in order, but narrows nothing down
+        sql = str(Commit.objects.order_by('-timestamp', '-id').values('id').query)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            self.assertIn('USING', cursor.fetchall()[-1][-1])
+        self.assertEqual(self.full_scans(sql), {'analyzer_commit'})
+
+    def test_commit_aggregations(self):
+        for action in ('by_author', 'by_repository', 'by_project'):
+            self.assertIndexed(f'/api/commits/{action}/?days=30')
+
+    def test_commit_pages(self):
+        deep = self.client.get('/api/commits/').json()['next']
+        self.assertIndexed(deep)
+        self.assertIndexed(f'{deep}&repository={self.repository.id}')
+        self.assertIndexed(f'{deep}&author={self.author.id}&since=2020-01-01')
+
+    def test_active_per_week(self):
+        self.assertIndexed('/api/commits/active_per_week/?projects=project&days=30&weeks=8')
+
+    def test_detail_serializers(self):
+        self.assertIndexed(f'/api/projects/{self.project.id}/?detail=1')
+        self.assertIndexed(f'/api/repositories/{self.repository.id}/?detail=1')
+        self.assertIndexed(f'/api/authors/{self.author.id}/?detail=1')
+
+
+class ResponseCacheTest(TestCase):
+    """Aggregations are cached until the data generation changes"""
+
+    def setUp(self):
+        caches['api'].clear()
+        project = Project.objects.create(name='project')
+        self.repository = Repository.objects.create(name='alpha', project=project, url='https://example.com/alpha.git')
+        self.author = Author.objects.create(name='Author', slug='author')
+
+    def add_commit(self, number):
+        Commit.objects.create(hash=f'{number:040x}', author=self.author, repository=self.repository,
+                              timestamp=timezone.now(), message='')
+        DailyCommits.refresh(self.repository)
+
+    def test_generation_invalidates(self):
+        self.add_commit(1)
+        self.assertEqual(self.client.get('/api/commits/by_author/').json()[0]['commits'], 1)
+
+        self.add_commit(2)
+        with self.assertNumQueries(2):
+            # Only the generation and the last_fetch for Last-Modified are read
+            self.assertEqual(self.client.get('/api/commits/by_author/').json()[0]['commits'], 1)
+
+        Generation.bump()
+        self.assertEqual(self.client.get('/api/commits/by_author/').json()[0]['commits'], 2)
+        # Different parameters are cached separately
+        self.assertEqual(self.client.get('/api/commits/by_author/?days=1').json()[0]['commits'], 2)
+
+
+class ConditionalGetTest(TestCase):
+    """Clients revalidate with the ETag and get a 304 while nothing changed"""
+
+    def setUp(self):
+        caches['api'].clear()
+        project = Project.objects.create(name='project')
+        self.repository = Repository.objects.create(name='alpha', project=project, url='https://example.com/alpha.git',
+                                                    last_fetch=timezone.now())
+
+    def test_not_modified_until_generation_changes(self):
+        first = self.client.get('/api/commits/by_project/')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        with self.assertNumQueries(2):
+            # Only the generation and last_fetch are read
+            second = self.client.get('/api/commits/by_project/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+        other = self.client.get('/api/commits/by_project/?days=30', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(other.status_code, 200)
+
+        Generation.bump()
+        third = self.client.get('/api/commits/by_project/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+
+    def test_new_day_changes_etag(self):
+        first = self.client.get('/api/commits/by_project/')
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch('django.utils.timezone.localdate', return_value=tomorrow):
+            second = self.client.get('/api/commits/by_project/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_last_modified_of_detail_route(self):
+        url = f'/api/repositories/{self.repository.id}/'
+        since = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, headers={'If-Modified-Since': since}).status_code, 304)
+
+
+class QueryBudgetTest(TestCase):
+    """Endpoints run a fixed number of queries however many rows they return"""
+
+    def setUp(self):
+        caches['api'].clear()
+        self.rows = 0
+        self.grow()
+
+    def grow(self):
+        """Add two projects with two repositories and two authors each, all
+        of them with recent commits"""
+        now = timezone.now()
+        for _ in range(2):
+            self.rows += 1
+            project = Project.objects.create(name=f'project-{self.rows}')
+            authors = [Author.objects.create(name=f'Author {self.rows}.{n}', slug=f'author-{self.rows}-{n}') for n in range(2)]
+            for n in range(2):
+                repository = Repository.objects.create(name=f'repository-{self.rows}-{n}', project=project,
+                                                       url=f'https://example.com/{self.rows}/{n}.git')
+                Commit.objects.bulk_create(
+                    Commit(hash=f'{self.rows:08x}{n:08x}{i:024x}', author=authors[i % 2], repository=repository,
+                           timestamp=now - timedelta(hours=i), message='')
+                    for i in range(5))
+                DailyCommits.refresh(repository)
+        Generation.bump()
+
+    def assertQueryBudget(self, url, budget):
+        """Request url before and after adding rows, and fail unless both
+        stayed within budget queries"""
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertLessEqual(len(queries), budget,
+                                 f'{url}: ' + '\n'.join(query['sql'] for query in queries))
+            self.grow()
+
+    def test_detail_lists(self):
+        # generation and last_fetch for the ETag come first
+        self.assertQueryBudget('/api/authors/?detail=1', 4)
+        self.assertQueryBudget('/api/repositories/?detail=1', 4)
+        self.assertQueryBudget('/api/projects/?detail=1', 4)
+
+    def test_detail_routes(self):
+        self.assertQueryBudget(f'/api/authors/{Author.objects.first().id}/?detail=1', 4)
+        self.assertQueryBudget(f'/api/repositories/{Repository.objects.first().id}/?detail=1', 4)
+        self.assertQueryBudget(f'/api/projects/{Project.objects.first().id}/?detail=1', 4)
+
+    def test_aggregations(self):
+        for action in ('by_author', 'by_repository', 'by_project'):
+            self.assertQueryBudget(f'/api/commits/{action}/', 3)
+
+    def test_async_routes(self):
+        self.assertQueryBudget(f'/api/async/authors/{Author.objects.first().id}/', 4)
+        self.assertQueryBudget(f'/api/async/repositories/{Repository.objects.first().id}/', 4)
+        self.assertQueryBudget(f'/api/async/projects/{Project.objects.first().id}/', 4)
+        for action in ('by_author', 'by_repository', 'by_project'):
+            self.assertQueryBudget(f'/api/async/commits/{action}/', 3)
+
+
+def create_recent_commits():
+    """One project with a repository and an author with five recent commits"""
+    now = timezone.now()
+    project = Project.objects.create(name='project')
+    author = Author.objects.create(name='Author', slug='author')
+    repository = Repository.objects.create(name='alpha', project=project, url='https://example.com/alpha.git',
+                                           last_fetch=now)
+    Commit.objects.bulk_create(
+        Commit(hash=f'{i:040x}', author=author, repository=repository, timestamp=now - timedelta(hours=i),
+               message=f'commit {i}')
+        for i in range(5))
+    DailyCommits.refresh(repository)
+
+
+class AsyncViewTest(TestCase):
+    """The async endpoints answer like their DRF counterparts"""
+
+    def setUp(self):
+        caches['api'].clear()
+        create_recent_commits()
+
+    def test_same_json(self):
+        project = Project.objects.first()
+        pairs = [(f'/api/commits/{action}/?days=30', f'/api/async/commits/{action}/?days=30')
+                 for action in ('by_author', 'by_repository', 'by_project')]
+        pairs += [
+            (f'/api/commits/active_per_week/?projects={project.name}',
+             f'/api/async/commits/active_per_week/?projects={project.name}'),
+            (f'/api/authors/{Author.objects.first().id}/?detail=1', f'/api/async/authors/{Author.objects.first().id}/'),
+            (f'/api/repositories/{Repository.objects.first().id}/?detail=1',
+             f'/api/async/repositories/{Repository.objects.first().id}/'),
+            (f'/api/projects/{project.id}/?detail=1', f'/api/async/projects/{project.id}/'),
+        ]
+        for sync_url, async_url in pairs:
+            self.assertEqual(self.client.get(async_url).json(), self.client.get(sync_url).json(), async_url)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/api/async/repositories/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/async/commits/active_per_week/').status_code, 400)
+        self.assertEqual(self.client.get('/api/async/commits/active_per_week/?projects=missing').status_code, 404)
+        self.assertEqual(self.client.post('/api/async/commits/by_author/').status_code, 405)
+
+    def test_not_modified(self):
+        first = self.client.get('/api/async/commits/by_project/')
+        self.assertIn('no-cache', first['Cache-Control'])
+        with self.assertNumQueries(2):
+            second = self.client.get('/api/async/commits/by_project/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+
+class ColumnarFormatTest(TestCase):
+    """?format=columnar carries the same values as the list of objects"""
+
+    def setUp(self):
+        caches['api'].clear()
+        create_recent_commits()
+
+    def rows(self, data, tables=()):
+        result = []
+        for i in range(data['rows']):
+            row = {field: values[i] for field, values in data['columns'].items()}
+            for name, key in tables:
+                row[key] = {field: values[row[key]] for field, values in data[name].items()}
+            result.append(row)
+        return result
+
+    def test_same_values(self):
+        for action, tables in (('by_author', ()), ('by_repository', (('projects', 'project'),))):
+            objects = self.client.get(f'/api/commits/{action}/?format=json').json()
+            columnar = self.client.get(f'/api/commits/{action}/?format=columnar')
+            self.assertEqual(columnar['Content-Type'], 'application/json')
+            self.assertEqual(self.rows(columnar.json(), tables), objects, action)
+        self.assertEqual(self.client.get('/api/commits/by_project/?format=columnar').status_code, 404)
+
+    def test_projects_sent_once(self):
+        project = Project.objects.get()
+        Repository.objects.create(name='beta', project=project, url='https://example.com/beta.git')
+        DailyCommits.objects.create(author=Author.objects.get(), repository=Repository.objects.get(name='beta'),
+                                    day=timezone.localdate(), commits=1)
+        data = self.client.get('/api/commits/by_repository/?format=columnar').json()
+        self.assertEqual(data['columns']['project'], [0, 0])
+        self.assertEqual(data['projects']['name'], ['project'])
+
+
+class ExportTest(TestCase):
+    """Commits and contribs stream as NDJSON or CSV"""
+
+    def setUp(self):
+        create_recent_commits()
+
+    def content(self, url):
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, 200)
+        return b''.join(result.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        lines = self.content('/api/commits/export/').splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['repository__name'], 'alpha')
+
+    def test_csv(self):
+        lines = self.content('/api/commits/export/?format=csv').splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'hash', 'timestamp'])
+        self.assertEqual(len(lines), 6)
+
+    def test_filters(self):
+        repository = Repository.objects.get()
+        since = quote((timezone.now() - timedelta(hours=2, minutes=30)).isoformat())
+        self.assertEqual(len(self.content(f'/api/commits/export/?since={since}').splitlines()), 3)
+        self.assertEqual(len(self.content(f'/api/commits/export/?until={since}').splitlines()), 2)
+        self.assertEqual(len(self.content(f'/api/commits/export/?repository={repository.id}').splitlines()), 5)
+        self.assertEqual(self.content(f'/api/commits/export/?project={repository.project_id + 1}'), '')
+        self.assertEqual(self.client.get('/api/commits/export/?since=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/commits/export/?author=me').status_code, 400)
+
+    async def test_asgi_streams_asynchronously(self):
+        result = await self.async_client.get('/api/commits/export/?format=csv')
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.is_async)
+        lines = b''.join([chunk async for chunk in result.streaming_content]).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 6)
+
+    def test_contribs(self):
+        Contrib.objects.create(author=Author.objects.get(), repository=Repository.objects.get(), count=5)
+        lines = self.content('/api/contribs/export/?format=csv').splitlines()
+        self.assertEqual(lines[1].split(',')[-1], '5')
+
+
+class KeysetPaginationTest(TestCase):
+    """Commits are listed newest first by (timestamp, id), ties included"""
+
+    def setUp(self):
+        project = Project.objects.create(name='project')
+        author = Author.objects.create(name='Author', slug='author')
+        self.repositories = [Repository.objects.create(name=name, project=project, url=f'https://example.com/{name}.git')
+                             for name in ('alpha', 'beta')]
+        now = timezone.now()
+        # Three commits share each timestamp
+        Commit.objects.bulk_create(
+            Commit(hash=f'{i:040x}', author=author, repository=self.repositories[i % 2],
+                   timestamp=now - timedelta(minutes=i // 3), message='')
+            for i in range(250))
+
+    def walk(self, url, link='next'):
+        """Returns: the pages from url on, following link"""
+        pages = []
+        while url:
+            page = self.client.get(url).json()
+            pages.append(page)
+            url = page[link]
+        return pages
+
+    def test_forward_and_back(self):
+        pages = self.walk('/api/commits/')
+        self.assertEqual([len(page['results']) for page in pages], [100, 100, 50])
+        self.assertIsNone(pages[0]['previous'])
+        expected = list(Commit.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        self.assertEqual([commit['id'] for page in pages for commit in page['results']], expected)
+
+        back = self.walk(pages[-1]['previous'], 'previous')
+        self.assertEqual([page['results'] for page in back], [page['results'] for page in pages[-2::-1]])
+
+    def test_filters(self):
+        repository = self.repositories[1]
+        pages = self.walk(f'/api/commits/?repository={repository.id}')
+        self.assertEqual(sum(len(page['results']) for page in pages), 125)
+        self.assertTrue(all(commit['repository'] == repository.id for page in pages for commit in page['results']))
+        self.assertIn(f'repository={repository.id}', pages[0]['next'])
+
+        since = quote((timezone.now() - timedelta(minutes=10)).isoformat())
+        self.assertEqual(len(self.client.get(f'/api/commits/?since={since}').json()['results']), 30)
+        self.assertEqual(self.client.get('/api/commits/?until=never').status_code, 400)
+        self.assertEqual(self.client.get('/api/commits/?cursor=bogus').status_code, 404)
+
+
+class RefreshStatsTest(TestCase):
+    """analyze recomputes the totals of repositories and projects once per run"""
+
+    def analyzed(self, count):
+        """Create count repositories, in projects of two, with two
+        contributors each, one of them shared by the whole project.
+        Returns: results of import_repo for them"""
+        results = []
+        start = Repository.objects.count()
+        for n in range(start, start + count):
+            if n % 2 == 0:
+                project = Project.objects.create(name=f'project-{n}')
+                shared = Author.objects.create(name=f'Shared {n}', slug=f'shared-{n}')
+            repository = Repository.objects.create(name=f'repository-{n}', project=project, path=f'/repos/{n}',
+                                                   url=f'https://example.com/{n}.git', lines=-1)
+            own = Author.objects.create(name=f'Author {n}', slug=f'author-{n}')
+            Contrib.objects.create(author=shared, repository=repository, count=10)
+            Contrib.objects.create(author=own, repository=repository, count=n)
+            results.append((repository.path, 'success', ''))
+        return results
+
+    def test_totals(self):
+        AnalyzeCommand().refresh_stats(self.analyzed(4) + [('/repos/missing', 'failed', '')])
+        repository = Repository.objects.get(name='repository-3')
+        self.assertEqual((repository.lines, repository.contributors), (13, 2))
+        project = Project.objects.get(name='project-2')
+        self.assertEqual((project.lines, project.contributors), (25, 3))
+
+    def test_queries_do_not_grow(self):
+        queries = []
+        for count in (2, 8):
+            results = self.analyzed(count)
+            with CaptureQueriesContext(connection) as captured:
+                AnalyzeCommand().refresh_stats(results)
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+
+
+class WeeklyActivityTest(TestCase):
+    """weekly_activity builds the zero filled week by author matrix"""
+
+    def test_matrix(self):
+        today = date(2024, 3, 13)  # a Wednesday
+        rows = [
+            ('Ann', date(2024, 3, 11), 2), ('Ann', date(2024, 3, 13), 1),
+            ('Bob', date(2024, 2, 28), 4),
+            # Only active before the active period
+            ('Cid', date(2024, 1, 2), 5),
+            # Committer clocks in the future
+            ('Ann', date(2024, 4, 1), 7), ('Dan', date(2025, 1, 1), 1),
+        ]
+        activity = weekly_activity(rows, 30, 4, today)
+        self.assertEqual(activity['authors'], ['Ann', 'Bob'])
+        self.assertEqual([week['week_start'] for week in activity['weeks']],
+                         ['2024-02-12', '2024-02-19', '2024-02-26', '2024-03-04', '2024-03-11'])
+        self.assertEqual(activity['matrix'], [[0, 0], [0, 0], [0, 4], [0, 0], [3, 0]])
+        self.assertEqual(activity['totals'], [0, 0, 4, 0, 3])
+        self.assertEqual(activity['weeks'][-1]['week'], 'Mar 11 - Mar 17, 2024')
+
+    def test_future_commits_over_the_api(self):
+        create_recent_commits()
+        DailyCommits.objects.create(author=Author.objects.get(), repository=Repository.objects.get(),
+                                    day=timezone.localdate() + timedelta(days=30), commits=3)
+        caches['api'].clear()
+        for url in ('/api/commits/active_per_week/?projects=project', '/api/async/commits/active_per_week/?projects=project'):
+            result = self.client.get(url)
+            self.assertEqual(result.status_code, 200)
+            self.assertEqual(sum(result.json()['totals']), 5)
@@ -2,6 +2,7 @@ from rest_framework.routers import DefaultRouter
 from django.urls import path
 from .views import ProjectViewSet, AuthorViewSet, AliasViewSet, RepositoryViewSet, CommitViewSet, ContribViewSet
 from .views import gitdb_config, web_hook
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'projects', ProjectViewSet)
@@ -13,5 +14,12 @@ router.register(r'contribs', ContribViewSet)
 
 urlpatterns = [
     path('config/', gitdb_config, name='gitdb-config'),
-    path('webhook/', web_hook, name='gitdb-webhook' )
+    path('webhook/', web_hook, name='gitdb-webhook' ),
+    path('async/commits/by_author/', async_views.by_author, name='commit-async-by-author'),
+    path('async/commits/by_repository/', async_views.by_repository, name='commit-async-by-repository'),
+    path('async/commits/by_project/', async_views.by_project, name='commit-async-by-project'),
+    path('async/commits/active_per_week/', async_views.active_per_week, name='commit-async-active-per-week'),
+    path('async/authors/<int:pk>/', async_views.author_detail, name='author-async-detail'),
+    path('async/repositories/<int:pk>/', async_views.repository_detail, name='repository-async-detail'),
+    path('async/projects/<int:pk>/', async_views.project_detail, name='project-async-detail'),
 ] + router.urls
\ No newline at end of file
@@ -1,15 +1,26 @@
-from datetime import timedelta
-from django.db.models import Count, F, Q
-from django.db.models.functions import TruncWeek
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime, time, timedelta
+from django.db.models import F, Q, Sum
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import urlencode
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from rest_framework import viewsets, pagination, decorators, response
+from rest_framework import viewsets, pagination, decorators, exceptions, response
+from rest_framework.settings import api_settings
 
-from .models import Project, Author, Alias, Repository, Commit, Contrib
+from .cache import cached_response, conditional
+from .importer import normalize_url
+from .renderers import ColumnarRenderer, CSVRenderer, NDJSONRenderer, columnar
+from .models import Project, Author, Alias, Repository, Commit, Contrib, AnalysisJob, DailyCommits
 from .serializers import ProjectSerializer, AuthorSerializer, AuthorDetailSerializer
 from .serializers import AliasSerializer, RepositoryCommitSerializer
 from .serializers import RepositorySerializer, RepositoryDetailSerializer
@@ -22,6 +33,82 @@ class CustomCursorPagination(pagination.CursorPagination):
     ordering = 'pk'
 
 
+class KeysetPagination(pagination.BasePagination):
+    """Pages through commits newest first, ordered by (timestamp, id). The
+    cursor holds the timestamp and id of the last row of the page, and the
+    next page starts below it, so that a deep page costs as much as the
+    first one with the (-timestamp, -id) index of Commit. The response looks
+    like that of CursorPagination."""
+    page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        position, self.reverse = self.decode_cursor(request)
+        if position:
+            timestamp, pk = position
+            if self.reverse:
+                queryset = queryset.filter(Q(timestamp__gte=timestamp) & (Q(timestamp__gt=timestamp) | Q(pk__gt=pk)))
+            else:
+                queryset = queryset.filter(Q(timestamp__lte=timestamp) & (Q(timestamp__lt=timestamp) | Q(pk__lt=pk)))
+        ordering = ('timestamp', 'pk') if self.reverse else ('-timestamp', '-pk')
+
+        page = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if self.reverse:
+            page.reverse()
+
+        # Going backwards, what is left over comes before the page
+        self.has_next = bool(page) and (self.reverse and bool(position) or not self.reverse and more)
+        self.has_previous = bool(page) and (self.reverse and more or not self.reverse and bool(position))
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data):
+        return response.Response({
+            'next': self.get_link(self.page[-1], False) if self.has_next else None,
+            'previous': self.get_link(self.page[0], True) if self.has_previous else None,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return pagination.CursorPagination().get_paginated_response_schema(schema)
+
+    def get_link(self, commit, reverse):
+        params = self.request.query_params.copy()
+        position = f"{commit.timestamp.isoformat()}|{commit.pk}|{'r' if reverse else ''}"
+        params[self.cursor_query_param] = base64.urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+        return self.request.build_absolute_uri(f'{self.request.path}?{urlencode(params, doseq=True)}')
+
+    def decode_cursor(self, request):
+        """Returns: ((timestamp, id) or None, reverse)"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            timestamp, pk, reverse = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii').split('|')
+            moment = parse_datetime(timestamp)
+            if moment is None:
+                raise ValueError(timestamp)
+            return (moment, int(pk)), reverse == 'r'
+        except (TypeError, ValueError, UnicodeError):
+            raise exceptions.NotFound(self.invalid_cursor_message)
+
+
+# Renderers of by_author and by_repository, ?format=columnar selects the
+# columnar one. The few rows of by_project gain nothing from it.
+CHART_RENDERERS = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarRenderer]
+
+PROJECT_FIELDS = ['id', 'name', 'lines', 'contributors', 'last_fetch', 'skip']
+
+# Renderers of the exports, NDJSON unless ?format=csv
+EXPORT_RENDERERS = [NDJSONRenderer, CSVRenderer]
+EXPORT_CHUNK_SIZE = 2000
+
+
+@conditional
 class ProjectViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
@@ -32,79 +119,107 @@ class ProjectViewSet(viewsets.ReadOnlyModelViewSet):
         return ProjectSerializer
         
 
+@conditional
 class AuthorViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Author.objects.all()
 
+    def get_queryset(self):
+        if self.request.query_params.get('detail'):
+            return AuthorDetailSerializer.setup_eager_loading(super().get_queryset())
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.request.query_params.get('detail'):
             return AuthorDetailSerializer
         return AuthorSerializer
 
+@conditional
 class AliasViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Alias.objects.all()
     serializer_class = AliasSerializer
 
 
+@conditional
 class RepositoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Repository.objects.all()
 
+    def get_queryset(self):
+        if self.request.query_params.get('detail'):
+            return RepositoryDetailSerializer.setup_eager_loading(super().get_queryset())
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.request.query_params.get('detail'):
             return RepositoryDetailSerializer
         return RepositorySerializer
 
 
+@conditional
 class CommitViewSet(viewsets.ReadOnlyModelViewSet):
+    """Commits newest first, filtered by the project, repository and author
+    ids and by since and until (ISO dates or datetimes, until is exclusive)"""
     queryset = Commit.objects.all()
     serializer_class = CommitSerializer
-    pagination_class = CustomCursorPagination
+    pagination_class = KeysetPagination
 
-    @decorators.action(detail=False, methods=['get'])
+    def get_queryset(self):
+        return filtered(super().get_queryset(), self.request.query_params, 'timestamp')
+
+    @decorators.action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request, *args, **kwargs):
+        """Streams all commits as NDJSON or, with ?format=csv, CSV, filtered
+        like the list."""
+        fields = ['id', 'hash', 'timestamp', 'author', 'author__name', 'repository', 'repository__name',
+                  'repository__project', 'repository__project__name', 'message']
+        return export_response(request, self.get_queryset(), fields, 'commits')
+
+    @decorators.action(detail=False, methods=['get'], renderer_classes=CHART_RENDERERS)
+    @cached_response
     def by_author(self, request, *args, **kwargs):
         """Counts total commits by author.
-        Filtered by the number of days and defaults to 7 if not provided"""
-        days = request.query_params.get('days', 7)
-        since = timezone.now() - timedelta(days=int(days))
-        authors = Author.objects.filter(commit__timestamp__gte=since)\
-                                .annotate(commits=Count('commit'))\
-                                .order_by('-commits')
+        Filtered by the number of days and defaults to 7 if not provided.
+        Counts come from the DailyCommits rollup, the first day is counted in full."""
+        authors = author_commits(since_day(request.query_params))
+        if request.accepted_renderer.format == 'columnar':
+            fields = ['id', 'name', 'slug', 'commits']
+            return response.Response(columnar(authors.values(*fields), fields))
         serializer = AuthorCommitSerializer(authors, many=True)
-
-        print(authors.query)
         return response.Response(serializer.data)
     
 
-    @decorators.action(detail=False, methods=['get'])
+    @decorators.action(detail=False, methods=['get'], renderer_classes=CHART_RENDERERS)
+    @cached_response
     def by_repository(self, request, *args, **kwargs):
         """Counts total commits by repository.
-        Filtered by the number of days and defaults to 7 if not provided"""
-        days = request.query_params.get('days', 7)
-        since = timezone.now() - timedelta(days=int(days))
-        repositories = Repository.objects.filter(commit__timestamp__gte=since)\
-                                        .annotate(commits=Count('commit'))\
-                                        .order_by('-commits')
+        Filtered by the number of days and defaults to 7 if not provided.
+        In the columnar format the project column holds positions in the
+        projects table."""
+        repositories = repository_commits(since_day(request.query_params))
+        if request.accepted_renderer.format == 'columnar':
+            fields = ['id', 'last_fetch', 'url', 'lines', 'contributors', 'skip', 'success', 'commits', 'name']
+            rows = repositories.values(*fields, 'project', *(f'project__{field}' for field in PROJECT_FIELDS))
+            return response.Response(columnar(rows, fields, {'projects': ('project', PROJECT_FIELDS)}))
         serializer = RepositoryCommitSerializer(repositories, many=True)
         return response.Response(serializer.data)
     
 
     @decorators.action(detail=False, methods=['get'])
+    @cached_response
     def by_project(self, request, *args, **kwargs):
-        days = request.query_params.get('days', 7)
-        since = timezone.now() - timedelta(days=int(days))
-        projects = Project.objects.filter(repository__commit__timestamp__gte=since)\
-                                  .annotate(commits=Count('repository__commit'))\
-                                  .order_by('-commits')
+        projects = project_commits(since_day(request.query_params))
         serializer = ProjectCommitSerializer(projects, many=True)
         return response.Response(serializer.data)
 
     @decorators.action(detail=False, methods=['get'])
+    @cached_response
     def active_per_week(self, request, *args, **kwargs):
         """Returns commits per active committer per week across specified projects.
         
         This endpoint identifies 'active committers' as those with commits in the
         lookback period (default 90 days) and shows their weekly commit activity.
         
-        Returns both per-author breakdown and aggregate (team total) data.
+        Returns a week by author matrix with every week of the period, weeks
+        without commits are zero, and the team total of each week.
         
         Query params:
         - projects: REQUIRED - comma-separated project names (e.g., 'BM,RMS,PHAR')
@@ -112,8 +227,10 @@ class CommitViewSet(viewsets.ReadOnlyModelViewSet):
         - weeks: number of weeks to display (default: 24)
         
         Returns: {
-            by_author: [{week: 'YYYY-W##', author: 'name', commits: count}, ...],
-            aggregate: [{week: 'YYYY-W##', total_commits: count}, ...],
+            weeks: [{week: 'Jan 01 - Jan 07, 2024', week_start: 'YYYY-MM-DD'}, ...],
+            authors: ['name', ...],
+            matrix: [[commits of each author] for each week],
+            totals: [commits of the team for each week],
             metadata: {
                 projects: [...],
                 active_authors_count: int,
@@ -125,15 +242,10 @@ class CommitViewSet(viewsets.ReadOnlyModelViewSet):
             GET /api/commits/active_per_week/?projects=BM,RMS,PHAR
             GET /api/commits/active_per_week/?projects=RMS&days=180&weeks=52
         """
-        # Get and validate projects parameter
-        projects_param = request.query_params.get('projects')
-        if not projects_param:
-            return response.Response(
-                {'error': 'projects parameter is required. Example: ?projects=BM,RMS,PHAR'},
-                status=400
-            )
-        
-        project_list = [p.strip() for p in projects_param.split(',') if p.strip()]
+        try:
+            project_list, active_days, weeks_back = activity_params(request.query_params)
+        except ValueError as e:
+            return response.Response({'error': str(e)}, status=400)
         
         # Verify projects exist in database
         existing_projects = Project.objects.filter(name__in=project_list).values_list('name', flat=True)
@@ -144,97 +256,200 @@ class CommitViewSet(viewsets.ReadOnlyModelViewSet):
                 status=404
             )
         
-        # Validate integer parameters
-        try:
-            active_days = int(request.query_params.get('days', 90))
-            weeks_back = int(request.query_params.get('weeks', 24))
-        except ValueError as e:
-            return response.Response(
-                {'error': 'days and weeks parameters must be integers'},
-                status=400
-            )
-        
-        print(f"[active_per_week] Analyzing projects: {project_list}, active_days={active_days}, weeks_back={weeks_back}")
-        
-        # Determine active committers (anyone with commits in last N days)
-        active_cutoff = timezone.now() - timedelta(days=active_days)
-        active_authors = Author.objects.filter(
-            commit__repository__project__name__in=project_list,
-            commit__timestamp__gte=active_cutoff
-        ).distinct()
-        
-        active_author_names = list(active_authors.values_list('name', flat=True).order_by('name'))
-        
-        # Get commits for the chart period
-        chart_cutoff = timezone.now() - timedelta(weeks=weeks_back)
-        commits = Commit.objects.filter(
-            repository__project__name__in=project_list,
-            author__in=active_authors,
-            timestamp__gte=chart_cutoff
-        ).annotate(
-            week=TruncWeek('timestamp')
-        ).values('week', 'author__name').annotate(
-            commits=Count('id')
-        ).order_by('week', 'author__name')
-        
-        # Format per-author data with date ranges
-        by_author_data = []
-        for commit in commits:
-            week_date = commit['week']
-            # Format as "Jan 1 - Jan 7, 2024"
-            week_end = week_date + timedelta(days=6)
-            week_label = f"{week_date.strftime('%b %d')} - {week_end.strftime('%b %d, %Y')}"
-            
-            by_author_data.append({
-                'week': week_label,
-                'week_start': week_date.isoformat(),
-                'author': commit['author__name'],
-                'commits': commit['commits']
-            })
-        
-        # Calculate aggregate data (total commits per week)
-        aggregate_commits = Commit.objects.filter(
-            repository__project__name__in=project_list,
-            author__in=active_authors,
-            timestamp__gte=chart_cutoff
-        ).annotate(
-            week=TruncWeek('timestamp')
-        ).values('week').annotate(
-            total_commits=Count('id')
-        ).order_by('week')
-        
-        aggregate_data = []
-        for commit in aggregate_commits:
-            week_date = commit['week']
-            week_end = week_date + timedelta(days=6)
-            week_label = f"{week_date.strftime('%b %d')} - {week_end.strftime('%b %d, %Y')}"
-            
-            aggregate_data.append({
-                'week': week_label,
-                'week_start': week_date.isoformat(),
-                'total_commits': commit['total_commits']
-            })
-        
-        print(f"[active_per_week] Found {active_authors.count()} active authors with {len(by_author_data)} author-week combinations")
-        
+        today = timezone.localdate()
+        rows = activity_rows(project_list, active_days, weeks_back, today)
+        activity = weekly_activity(rows, active_days, weeks_back, today)
+        print(f"[active_per_week] Found {len(activity['authors'])} active authors over {len(activity['weeks'])} weeks")
+
         return response.Response({
-            'by_author': by_author_data,
-            'aggregate': aggregate_data,
+            **activity,
             'metadata': {
                 'projects': list(project_list),
-                'active_authors_count': active_authors.count(),
-                'active_authors': active_author_names,
+                'active_authors_count': len(activity['authors']),
+                'active_authors': activity['authors'],
                 'active_days': active_days,
                 'weeks_back': weeks_back
             }
         })
 
 
+def since_day(params):
+    """Returns: the first day of the window given by the days parameter"""
+    days = params.get('days', 7)
+    return timezone.localdate() - timedelta(days=int(days))
+
+
+def author_commits(since):
+    """Returns: queryset of the authors with their commits from the day since"""
+    return Author.objects.filter(dailycommits__day__gte=since)\
+                         .annotate(commits=Sum('dailycommits__commits'))\
+                         .order_by('-commits')
+
+
+def repository_commits(since):
+    """Returns: queryset of the repositories, with their projects, and their
+    commits from the day since"""
+    return Repository.objects.filter(dailycommits__day__gte=since)\
+                             .select_related('project')\
+                             .annotate(commits=Sum('dailycommits__commits'))\
+                             .order_by('-commits')
+
+
+def project_commits(since):
+    """Returns: queryset of the projects with their commits from the day since"""
+    return Project.objects.filter(repository__dailycommits__day__gte=since)\
+                          .annotate(commits=Sum('repository__dailycommits__commits'))\
+                          .order_by('-commits')
+
+
+def activity_params(params):
+    """Parse the query parameters of active_per_week.
+    Returns: tuple of the project names, active days and weeks back
+    Raises: ValueError with the message for the client"""
+    projects_param = params.get('projects')
+    if not projects_param:
+        raise ValueError('projects parameter is required. Example: ?projects=BM,RMS,PHAR')
+    project_list = [p.strip() for p in projects_param.split(',') if p.strip()]
+
+    try:
+        return project_list, int(params.get('days', 90)), int(params.get('weeks', 24))
+    except ValueError:
+        raise ValueError('days and weeks parameters must be integers')
+
+
+def activity_rows(project_list, active_days, weeks_back, today):
+    """Returns: queryset of (author name, day, commits) rows of the projects
+    over the longer of the two periods of active_per_week, up to today.
+    Commits dated in the future by a wrong clock are left out."""
+    start = min(today - timedelta(days=active_days), today - timedelta(weeks=weeks_back))
+    return DailyCommits.objects.filter(
+        repository__project__name__in=project_list,
+        day__gte=start,
+        day__lte=today
+    ).values_list('author__name', 'day').annotate(commits=Sum('commits')).order_by()
+
+
+def weekly_activity(rows, active_days, weeks_back, today):
+    """Commits per week of the authors that committed in the last active_days,
+    from the rows of activity_rows. Every week of the period gets a row,
+    weeks without commits are filled with zeros.
+    Returns: {
+        weeks: [{week: 'Jan 01 - Jan 07, 2024', week_start: 'YYYY-MM-DD'}, ...] (oldest first),
+        authors: [names of the active authors, sorted],
+        matrix: [[commits of each author] for each week],
+        totals: [commits of all active authors for each week]
+    }"""
+    active_cutoff = today - timedelta(days=active_days)
+    chart_cutoff = today - timedelta(weeks=weeks_back)
+
+    authors = sorted({name for name, day, commits in rows if active_cutoff <= day <= today})
+    column = {name: index for index, name in enumerate(authors)}
+
+    # Weeks start on Monday, like TruncWeek
+    first_week = chart_cutoff - timedelta(days=chart_cutoff.weekday())
+    week_starts = [first_week + timedelta(weeks=week) for week in range((today - first_week).days // 7 + 1)]
+    matrix = [[0] * len(authors) for _ in week_starts]
+    for name, day, commits in rows:
+        if chart_cutoff <= day <= today and name in column:
+            matrix[(day - first_week).days // 7][column[name]] += commits
+
+    weeks = []
+    for week_start in week_starts:
+        # Format as "Jan 01 - Jan 07, 2024"
+        week_end = week_start + timedelta(days=6)
+        weeks.append({
+            'week': f"{week_start.strftime('%b %d')} - {week_end.strftime('%b %d, %Y')}",
+            'week_start': week_start.isoformat(),
+        })
+
+    return {
+        'weeks': weeks,
+        'authors': authors,
+        'matrix': matrix,
+        'totals': [sum(row) for row in matrix],
+    }
+
+
+def parse_moment(value, end=False):
+    """Returns: aware datetime of an ISO date or datetime, a date stands
+    for its start"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'{value} is not a date or datetime')
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def row_filters(params, timestamp=None):
+    """Lookups for the project, repository and author query parameters,
+    which take ids, and for since and until on the timestamp field if there
+    is one.
+    Returns: dict for QuerySet.filter
+    Raises: ValueError with the message for the client"""
+    lookups = {}
+    for param, lookup in (('project', 'repository__project'), ('repository', 'repository'), ('author', 'author')):
+        if value := params.get(param):
+            if not value.isdigit():
+                raise ValueError(f'{param} must be an id')
+            lookups[lookup] = int(value)
+    if timestamp:
+        for param, lookup in (('since', 'gte'), ('until', 'lt')):
+            if value := params.get(param):
+                lookups[f'{timestamp}__{lookup}'] = parse_moment(value)
+    return lookups
+
+
+def filtered(queryset, params, timestamp=None):
+    """Returns: queryset filtered by row_filters
+    Raises: ParseError, a 400, for invalid parameters"""
+    try:
+        return queryset.filter(**row_filters(params, timestamp))
+    except ValueError as e:
+        raise exceptions.ParseError(str(e))
+
+
+def export_response(request, queryset, fields, name):
+    """Stream the fields of the rows of queryset in the format of the
+    accepted renderer. The rows are read chunk_size at a time, so memory does
+    not grow with the export. Under ASGI the content has to be an async
+    iterator, Django would read a sync one into a list before sending it.
+    Returns: StreamingHttpResponse"""
+    renderer = request.accepted_renderer
+    queryset = queryset.order_by('pk')
+    if isinstance(request._request, ASGIRequest):
+        # aiterator() cannot start a values_list() query from the event loop, a values() one it can
+        rows = (tuple(row.values()) async for row in queryset.values(*fields).aiterator(chunk_size=EXPORT_CHUNK_SIZE))
+        content = renderer.astream(rows, fields, EXPORT_CHUNK_SIZE)
+    else:
+        rows = queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        content = renderer.stream(rows, fields, EXPORT_CHUNK_SIZE)
+    result = StreamingHttpResponse(content,
+                                   content_type=f'{renderer.media_type}; charset={renderer.charset}')
+    result['Content-Disposition'] = f'attachment; filename="{name}.{renderer.format}"'
+    return result
+
+
+@conditional
 class ContribViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Contrib.objects.all()
     serializer_class = ContribSerializer
     pagination_class = CustomCursorPagination
 
+    def get_queryset(self):
+        return filtered(super().get_queryset(), self.request.query_params)
+
+    @decorators.action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request, *args, **kwargs):
+        """Streams all contribs as NDJSON or, with ?format=csv, CSV.
+        Filtered by the project, repository and author ids like the list."""
+        fields = ['id', 'author', 'author__name', 'repository', 'repository__name',
+                  'repository__project', 'repository__project__name', 'count']
+        return export_response(request, self.get_queryset(), fields, 'contribs')
+
 
 def home(request):
     print('bada')
@@ -246,10 +461,99 @@ def gitdb_config(request):
     return JsonResponse(settings.GITDB_CONFIG)
 
 
+def push_event(request):
+    """Find out where a webhook came from and which repository was pushed to.
+    GitHub, GitLab, Bitbucket Cloud and Bitbucket Server payloads are understood.
+    Returns: (source, repository name, list of repository URLs); the list is
+    empty for events other than pushes"""
+    if request.content_type == 'application/x-www-form-urlencoded':
+        payload = json.loads(request.POST.get('payload', '{}'))
+    else:
+        payload = json.loads(request.body or b'{}')
+    if not isinstance(payload, dict):
+        raise ValueError('payload is not a JSON object')
+
+    headers = request.headers
+    if 'X-GitHub-Event' in headers:
+        repository = payload.get('repository') or {}
+        urls = [repository.get(key) for key in ('clone_url', 'ssh_url', 'git_url', 'html_url')]
+        if headers['X-GitHub-Event'] != 'push':
+            urls = []
+        return 'github', repository.get('name'), urls
+
+    if 'X-Gitlab-Event' in headers:
+        project = payload.get('project') or {}
+        urls = [project.get(key) for key in ('git_http_url', 'git_ssh_url', 'web_url')]
+        if headers['X-Gitlab-Event'] not in ('Push Hook', 'Tag Push Hook'):
+            urls = []
+        return 'gitlab', project.get('path') or project.get('name'), urls
+
+    if 'X-Event-Key' in headers:
+        repository = payload.get('repository') or {}
+        links = repository.get('links') or {}
+        urls = [link.get('href') for link in links.get('clone', [])]
+        if isinstance(links.get('html'), dict):
+            urls.append(links['html'].get('href'))
+        if repository.get('full_name'):
+            # Bitbucket Cloud does not send clone links
+            urls.append(f"https://bitbucket.org/{repository['full_name']}")
+        if headers['X-Event-Key'] not in ('repo:push', 'repo:refs_changed'):
+            urls = []
+        return 'bitbucket', repository.get('slug') or repository.get('name'), urls
+
+    return None, None, []
+
+
+def signed(request, secret):
+    """Check a webhook against the shared secret: GitLab sends the secret
+    itself in X-Gitlab-Token, GitHub (X-Hub-Signature-256) and Bitbucket
+    (X-Hub-Signature) an HMAC-SHA256 of the body keyed with it.
+    Returns: True if the request carries a matching token or signature"""
+    if token := request.headers.get('X-Gitlab-Token'):
+        return hmac.compare_digest(token.encode(), secret.encode())
+    signature = request.headers.get('X-Hub-Signature-256') or request.headers.get('X-Hub-Signature') or ''
+    digest = hmac.new(secret.encode(), request.body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature.encode(), f'sha256={digest}'.encode())
+
+
+def find_repository(urls):
+    """Match the URLs of a webhook against the remote URLs of the analyzed
+    repositories. The name alone is not enough, a fork or a repository on
+    another host can have the same one.
+    Returns: Repository or None"""
+    keys = {normalize_url(url) for url in urls if url}
+    candidates = Repository.objects.select_related('project')
+    for key in keys:
+        for repository in candidates.filter(url__icontains=key.rsplit('/', 1)[-1]):
+            if normalize_url(repository.url) in keys:
+                return repository
+    return None
+
+
 @csrf_exempt
+@require_POST
 def web_hook(request):
-    """Webhook for bitbucket, github or gitlab"""
-    # dump the payload to the console along with the headers
-    print(request.headers)
-    print(request.body)
-    return JsonResponse({'status': 'ok'})
+    """Webhook for bitbucket, github or gitlab.
+    Pushes queue an AnalysisJob for the repository, which analyze_worker
+    picks up once settings.GITDB_WEBHOOK_DELAY seconds have passed.
+    With settings.GITDB_WEBHOOK_SECRET set, unsigned requests are refused."""
+    if settings.GITDB_WEBHOOK_SECRET and not signed(request, settings.GITDB_WEBHOOK_SECRET):
+        return JsonResponse({'status': 'error', 'error': 'invalid signature'}, status=403)
+
+    try:
+        source, name, urls = push_event(request)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'error': 'payload is not a valid JSON object'}, status=400)
+
+    if not urls:
+        return JsonResponse({'status': 'ignored'})
+
+    repository = find_repository(urls)
+    if repository is None:
+        return JsonResponse({'status': 'unknown repository', 'name': name}, status=404)
+    if repository.skip or repository.project.skip:
+        return JsonResponse({'status': 'skipped', 'repository': repository.name})
+
+    job = AnalysisJob.enqueue(repository, source, settings.GITDB_WEBHOOK_DELAY)
+    return JsonResponse({'status': 'queued', 'repository': repository.name, 'job': job.id, 'pushes': job.pushes},
+                        status=202)
@@ -0,0 +1,23 @@
+"""
+Entry points of the analysis pool processes of the analyze command.
+
+They live apart from the command so that a process started with forkserver or
+spawn can import them before Django is set up: the models are only imported
+once init_worker has run.
+"""
+import django
+from django.db import connections
+
+
+def init_worker():
+    """Prepares a pool process: Django is set up (needed for the forkserver
+    and spawn start methods) and inherited database connections are dropped
+    so that the worker opens its own."""
+    django.setup()
+    connections.close_all()
+
+
+def import_worker(repo_path, repo_options):
+    """Runs import_repo for a single repository inside a pool process"""
+    from analyzer.management.commands.analyze import Command
+    return Command().import_repo(repo_path, **repo_options)
@@ -79,6 +79,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # analyze --jobs writes from several processes: WAL lets readers carry
+        # on while a writer is active, IMMEDIATE transactions take the write
+        # lock up front and the timeout makes the others wait for it.
+        'OPTIONS': {
+            'timeout': 30,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
+        # A file rather than memory, so that the worker processes of a test
+        # run with --jobs see the same database
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -124,6 +135,30 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cached dashboard API responses (see analyzer.cache). Entries of older data
+# generations are not read again and are dropped when they expire or when the
+# cache is full. Each process has its own copy, settings_local may point this
+# at a shared backend such as redis instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# Pushes to a repository within this many seconds of the first one are
+# analyzed together (see analyzer.views.web_hook)
+GITDB_WEBHOOK_DELAY = 60
+
+# Shared secret of the webhooks; when set, requests without a matching
+# signature or token are refused with 403 (see analyzer.views.signed)
+GITDB_WEBHOOK_SECRET = None
+
 try:
     from .settings_local import *
 except ImportError:
@@ -6,7 +6,7 @@ export function ActivePerWeek({ loaded }) {
     const today = new Date();
     const weeksFromStart = Math.ceil((today - startDate) / (7 * 24 * 60 * 60 * 1000));
 
-    const [apiData, setApiData] = useState({ by_author: [], aggregate: [], metadata: {} });
+    const [apiData, setApiData] = useState({ weeks: [], authors: [], matrix: [], totals: [], metadata: {} });
     const [selectedProjects, setSelectedProjects] = useState(['BM', 'RMS', 'PHAR']);
     const [activeDays, setActiveDays] = useState(90);
     const [weeksDisplay, setWeeksDisplay] = useState(weeksFromStart);
@@ -31,7 +31,7 @@ export function ActivePerWeek({ loaded }) {
         if (!loaded) return;
         
         if (selectedProjects.length === 0) {
-            setApiData({ by_author: [], aggregate: [], metadata: {} });
+            setApiData({ weeks: [], authors: [], matrix: [], totals: [], metadata: {} });
             setError(null);
             setLoading(false);
             return;
@@ -65,7 +65,7 @@ export function ActivePerWeek({ loaded }) {
                 if (isMounted) {
                     console.error('Error fetching active_per_week:', err);
                     setError(err.message);
-                    setApiData({ by_author: [], aggregate: [], metadata: {} });
+                    setApiData({ weeks: [], authors: [], matrix: [], totals: [], metadata: {} });
                 }
             })
             .finally(() => {
@@ -80,36 +80,13 @@ export function ActivePerWeek({ loaded }) {
     // Draw per-author chart
     useEffect(() => {
         if (!loaded || viewMode !== 'per-author') return;
-        if (!apiData || !apiData.by_author || !Array.isArray(apiData.by_author) || apiData.by_author.length === 0) return;
+        if (!apiData || !Array.isArray(apiData.matrix) || apiData.authors.length === 0) return;
 
         try {
-            const data = apiData.by_author;
-            const weeks = new Map();
-            const authors = new Set();
-
-            if (!Array.isArray(data)) {
-                console.error('by_author data is not an array:', data);
-                setError('Invalid data format received from server');
-                return;
-            }
-
-            data.forEach(item => {
-                if (!weeks.has(item.week)) {
-                    weeks.set(item.week, {});
-                }
-                weeks.get(item.week)[item.author] = item.commits;
-                authors.add(item.author);
-            });
-
-            const sortedAuthors = Array.from(authors).sort();
-            const tableData = [['Week', ...sortedAuthors]];
-            Array.from(weeks.keys()).sort().forEach(week => {
-                const row = [week];
-                const weekData = weeks.get(week);
-                sortedAuthors.forEach(author => {
-                    row.push(weekData[author] || 0);
-                });
-                tableData.push(row);
+            // The server sends every week with a zero for each author without commits
+            const tableData = [['Week', ...apiData.authors]];
+            apiData.weeks.forEach((week, index) => {
+                tableData.push([week.week, ...apiData.matrix[index]]);
             });
 
             const dataTable = google.visualization.arrayToDataTable(tableData);
@@ -139,25 +116,17 @@ export function ActivePerWeek({ loaded }) {
             console.error('Error rendering per-author chart:', err);
             setError(err.message);
         }
-    }, [loaded, apiData.by_author, apiData.metadata, selectedProjects, viewMode]);
+    }, [loaded, apiData.matrix, apiData.metadata, selectedProjects, viewMode]);
 
     // Draw aggregate chart
     useEffect(() => {
         if (!loaded || viewMode !== 'aggregate') return;
-        if (!apiData || !apiData.aggregate || !Array.isArray(apiData.aggregate) || apiData.aggregate.length === 0) return;
+        if (!apiData || !Array.isArray(apiData.totals) || apiData.authors.length === 0) return;
 
         try {
-            const data = apiData.aggregate;
             const tableData = [['Week', 'Total Commits']];
-
-            if (!Array.isArray(data)) {
-                console.error('aggregate data is not an array:', data);
-                setError('Invalid data format received from server');
-                return;
-            }
-            
-            data.forEach(item => {
-                tableData.push([item.week, item.total_commits]);
+            apiData.weeks.forEach((week, index) => {
+                tableData.push([week.week, apiData.totals[index]]);
             });
 
             const dataTable = google.visualization.arrayToDataTable(tableData);
@@ -188,7 +157,7 @@ export function ActivePerWeek({ loaded }) {
             console.error('Error rendering aggregate chart:', err);
             setError(err.message);
         }
-    }, [loaded, apiData.aggregate, apiData.metadata, selectedProjects, viewMode]);
+    }, [loaded, apiData.totals, apiData.metadata, selectedProjects, viewMode]);
 
     const handleProjectToggle = (project) => {
         setSelectedProjects(prev => {
@@ -370,7 +339,7 @@ export function ActivePerWeek({ loaded }) {
                 </div>
             )}
 
-            {!loading && !error && ((viewMode === 'per-author' && apiData.by_author.length === 0) || (viewMode === 'aggregate' && apiData.aggregate.length === 0)) && selectedProjects.length > 0 && (
+            {!loading && !error && apiData.authors.length === 0 && selectedProjects.length > 0 && (
                 <div style={{ padding: '40px', textAlign: 'center', color: '#999', fontSize: '18px' }}>
                     No commit data found for the selected projects and criteria
                 </div>
@@ -379,5 +348,5 @@ export function ActivePerWeek({ loaded }) {
     );
 }
 
-console.log('active-per-week.jsx 0.03')
+console.log('active-per-week.jsx 0.04')
 